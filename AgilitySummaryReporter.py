@@ -7,24 +7,116 @@
 # for select columns.
 
 import csv
-import statistics
+from fractions import Fraction
 import numpy as np
-from matplotlib import pyplot as plt
-import matplotlib.dates as mdates
 import time
 import datetime
 import io
 import os
+import itertools
+import base64
+import bisect
+import argparse
+import concurrent.futures
+import hashlib
+import pickle
+import tempfile
+import collections
+import gc
+import glob
+import gzip
+import heapq
+import contextlib
+import cProfile
+import json
+import logging
+import pstats
+import tracemalloc
+import functools
+import operator
+import html
+import re
+import importlib.metadata
+import sys
 
 # Input & output files to use as parameters
 ppt_csv_file = 'PawPrint Trials Results.csv'
 ftr_csv_file = 'My Results.csv'
 report_file = 'report.html'
-debug_file = 'dump.html'
-debug_file_ppt = 'dump-ppt.html'
-debug_file_ftr = 'dump-ftr.html'
+debug_file = 'dump'
+debug_file_ppt = 'dump-ppt'
+debug_file_ftr = 'dump-ftr'
 CREATE_DEBUG_FILES = True
+# Format of the debug files: 'csv', 'jsonl' or 'html' (override with --dump-format);
+# the extension of the format is added to the debug file names
+DUMP_FORMAT = 'csv'
+# Compress the debug files with gzip (adds '.gz' to their names; override with --dump-gzip)
+DUMP_GZIP = False
+# Files the --leaderboard is saved to, as an HTML page, CSV and JSON
+# (the extension of each format is added to the name)
+leaderboard_file = 'leaderboard'
+# Dogs with fewer runs than this in a group are listed below the ranked dogs of its leaderboard
+LEADERBOARD_MIN_RUNS = 5
+# File the --profile summary is saved to (JSON), next to the report
+profile_file = 'profile.json'
+# File the raw cProfile stats of --profile-cprofile are saved to (for pstats or snakeviz)
+profile_stats_file = 'profile.pstats'
+# Level of the progress messages: 'debug' (each dog, table & plot), 'info', 'warning' or 'error'
+LOG_LEVEL = 'info'
+# Engine used to calculate the running averages: 'python' or 'numpy'
+# (override with --stats-backend)
+STATS_BACKEND = 'python'
+# Format of the plots: 'svg' (matplotlib), 'svg-lite' (compact SVG without matplotlib) or 'png'
+# (override with --plot-format)
+PLOT_FORMAT = 'svg'
+# Resolution of 'png' plots in dots per inch
+PLOT_DPI = 100
+# Max number of points of a plot; longer histories are downsampled to about this many,
+# which caps the size of each plot (override with --plot-max-points, 0 for no limit)
+PLOT_MAX_POINTS = 600
+# How plots with more than PLOT_MAX_POINTS are downsampled: 'lttb' (pick the points that
+# keep the shape of the lines), 'week' or 'month' (one point per week or month), or 'none'
+# (override with --plot-downsample)
+PLOT_DOWNSAMPLE = 'lttb'
+# Max number of x-axis ticks of a plot: a tick every month, or every few months for a long history
+PLOT_MAX_TICKS = 40
+# Number of worker processes to render plots (override with --jobs)
+PLOT_JOBS = 1
+# Directory to cache rendered tables & plots between runs, or None for no cache (override with --cache)
+CACHE_DIR = None
+# Max total size of the cache directory; the least recently used entries are removed
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Change this when the rendering changes so old cache entries are not used
+CACHE_VERSION = 2
 
+# Size of the write buffer of the HTML output files
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Directory to write the report to as an index page and a page per dog, or None for
+# the single report_file (override with --shard-dir)
+SHARD_DIR = None
+# Subdirectory of the shard directory with the plot files
+SHARD_PLOT_DIR = 'plots'
+# Directory to save the parsed CSV rows in, so the next run only parses appended rows,
+# or None to parse the full CSV files every time (override with --ingest-cache)
+INGEST_DIR = None
+# Change this when the parsed rows change so old ingest snapshots are not used
+INGEST_VERSION = 4
+# Directory to save the cleaned runs in as NumPy arrays, so the next report with the same
+# input files loads them instead of reading the CSV files, or None (override with --run-store)
+RUN_STORE_DIR = None
+# Change this when the Run fields (or the stats checkpoints) change so old run stores are not used
+RUN_STORE_VERSION = 4
+# Seconds between the checks of the input files for changes with --watch
+WATCH_INTERVAL = 2
+# Seconds the input files must stay unchanged before the report is built again with --watch
+# (so an export that is still being copied into the folder is not read half written)
+WATCH_DEBOUNCE = 5
+# Size of the chunks a CSV file is read in to hash its previously parsed rows
+INGEST_CHECK_CHUNK = 1024 * 1024
+
+
+# Logger of the progress messages (configured by main(), or by the program using this module)
+log = logging.getLogger('AgilitySummaryReporter')
 
 # List of columns in the 'PawPrintTrials' source CSV files. This needs to be updated if the CSV format changes.
 ppt_csv_cols = ["Date","Trial","Location","Dog","Handler","Class","Judge","Yards","SCT","Time","YPS","R","S","W","T","F","E","Score","Result","Place","MACH Pts","T2B Pts","Top25","Run ID"]
@@ -32,6 +124,9 @@ ppt_csv_cols = ["Date","Trial","Location","Dog","Handler","Class","Judge","Yards
 # List of columns in the 'FeelTheRush' source CSV files. This needs to be updated if the CSV format changes.
 ftr_csv_cols = ["Dogname","Trial Date","Club","Trial Day","Judge","Level","Class","SCT","Points","Time","Qual"]
 
+# Columns of the CSV files of each source, to tell the files apart by their header line
+source_cols = {"PawPrint": ppt_csv_cols, "FeelTheRush": ftr_csv_cols}
+
 # List of columns to include for for each table that is output
 table_cols = {
     "Master Std":   ["Date","Source","Club","Location","Judge","Trial Num","Yards","SCT","Time","YPS","Avg YPS","Avg15 YPS","Faults","Result","Avg Q Rate","Avg15 Q Rate","Place","MACH Pts","Avg MACH Pts","Avg15 MACH Pts"],
@@ -82,6 +177,10 @@ col_css = {
     "Avg T2B Pts":  ["60px", "center"],
     "Avg15 T2B Pts":["60px", "center"],
     "Top25":        ["46px", "center"],
+    "Rank":         ["45px", "center"],
+    "Runs":         ["45px", "center"],
+    "Qs":           ["45px", "center"],
+    "NAC MACH Pts": ["77px", "center", "#f0d70b"], #dark yellow
 
     'Filename':     ["235px", "left"],
     'Run Count':    ["100px", "center"],
@@ -89,8 +188,33 @@ col_css = {
     'Last Run Date':["200px", "left"],
 }
 
+# Columns that get running averages (stats) calculated
+stat_cols = ["Q Rate", "YPS", "Score", "MACH Pts", "T2B Pts"]
+
+# Stats columns that apply to each group: Q Rate plus those shown in the group's table
+group_stat_cols = {g: [c for c in stat_cols if c == "Q Rate" or c in table_cols[g]] for g in table_cols}
+
+# Number of most recent values used for the trailing ('Avg15') average of each stat column
+stat_windows = {"Q Rate":15, "YPS":15, "Score":15, "MACH Pts":15, "T2B Pts":15}
+
+# The NAC season starts on this day (Dec 1) and ends the day before it a year later
 nac_cutoff_day = 1
 nac_cutoff_month = 12
+# Groups whose MACH points count towards the NAC
+nac_groups = ("Master Std", "Master JWW")
+
+# Columns of the leaderboard of each group
+leaderboard_cols = ["Rank","Dog","Runs","Qs","Avg Q Rate","Avg15 Q Rate","Avg YPS","Avg15 YPS","MACH Pts","NAC MACH Pts","Top25"]
+
+# Column each leaderboard is sorted by (highest first); ties go by the Avg15 Q Rate, then the Runs
+leaderboard_sort_cols = {
+    "Master Std":   "NAC MACH Pts",
+    "Master JWW":   "NAC MACH Pts",
+    "Premier Std":  "Top25",
+    "Premier JWW":  "Top25",
+    "Master FAST":  "Avg15 Q Rate",
+    "T2B":          "Avg15 Q Rate",
+}
 
 # Global default delimiter for CSV reader.
 # TODO: I'm not sure it's necessary
@@ -102,47 +226,228 @@ FORMAT_DATE_TIME = "%m/%d/%Y %I:%M %p"
 # '12/04/2022'
 FORMAT_DATE = "%m/%d/%Y"
 
+# Number of distinct date strings remembered by parse_date() and format_date()
+# Trial exports only have a few hundred distinct dates, so this is plenty
+DATE_CACHE_SIZE = 4096
+
+# Max number of distinct texts (classes, levels, dog names, fault counts) memoized by the
+# lookups that normalize the CSV rows; an export only has a few dozen of each
+NORMALIZE_CACHE_SIZE = 4096
+
 # default date to use for missing dates: 12/31/1999
 DEFAULT_DATE = datetime.datetime(1999, 12, 31, 0, 0).date()
 
-# Reads a CSV input file into a list of dict using the column headings 
-def read_csv(file, csv_cols, source):
-    run_count = 0
-    runs = []
+# Columns of a Run (in the order they are dumped) and the attributes that hold them
+run_attrs = {
+    "Source": "source", "Date": "date", "Club": "club", "Location": "location",
+    "Dog": "dog", "Handler": "handler", "Judge": "judge", "Level": "level",
+    "Class": "agility_class", "Group": "group", "Trial Num": "trial_num",
+    "Yards": "yards", "SCT": "sct", "Time": "time", "YPS": "yps", "Faults": "faults",
+    "Score": "score", "Result": "result", "Place": "place", "MACH Pts": "mach_pts",
+    "T2B Pts": "t2b_pts", "Top25": "top25", "Run ID": "run_id",
+}
+
+# Position of each calculated stat column in Run.stats
+stat_positions = dict()
+for col in stat_cols:
+    stat_positions["Avg " + col] = len(stat_positions)
+    stat_positions["Avg15 " + col] = len(stat_positions)
+
+# Columns of a Run as read from a CSV file, before it is grouped and has stats
+read_cols = [col for col in run_attrs if col != "Group"]
+
+# Names of the fault counts, in the order of Run.faults
+fault_names = ("R","S","W","T","F","E")
+
+# One run of one dog, with typed fields in place of a dict of CSV text
+# The date is a date, the stats columns are floats (None when empty) and the faults are
+# a tuple of small ints. The calculated stats are in a list that is only created for runs
+# that have them. Values are only formatted as text by get(), when they are rendered;
+# get(), keys() and items() let a Run be used like the dict of column text it replaces.
+# class_text is the level & class text of the export, as it is, for run_key().
+class Run:
+    __slots__ = tuple(run_attrs.values()) + ('class_text', 'stats')
+
+    def __init__(self, source):
+        self.source = source
+        self.date = DEFAULT_DATE
+        self.club = ''
+        self.location = ''
+        self.dog = ''
+        self.handler = ''
+        self.judge = ''
+        self.level = ''
+        self.agility_class = ''
+        self.group = ''
+        self.trial_num = '1'
+        self.yards = ''
+        self.sct = ''
+        self.time = ''
+        self.yps = None
+        self.faults = (0, 0, 0, 0, 0, 0)
+        self.score = None
+        self.result = ''
+        self.place = ''
+        self.mach_pts = None
+        self.t2b_pts = None
+        self.top25 = ''
+        self.run_id = ''
+        self.class_text = ''
+        self.stats = None
+
+    # Text of a column, formatted for the report, or default if the run has no such value
+    def get(self, col, default=''):
+        attr = run_attrs.get(col)
+        if attr is not None:
+            return column_formats.get(col, str)(getattr(self, attr))
+        value = self.value(col)
+        if value is None:
+            return default
+        # Q Rate & the calculated stats are rounded to 2 decimals
+        return str(round(value, 2))
+
+    # Number in a stats column ("YPS", "Avg YPS", "Q Rate", ...), or None if there is none
+    def value(self, col):
+        if col == "Q Rate":
+            # the Q or NQ as a value of 0 or 10 for sane plotting
+            return 10.0 if self.result == "Q" else 0.0
+        attr = run_attrs.get(col)
+        if attr is not None:
+            return getattr(self, attr)
+        if self.stats is not None and col in stat_positions:
+            return self.stats[stat_positions[col]]
+        return None
+
+    # Set the calculated average and trailing average of a stats column
+    def set_stats(self, col, avg, recent_avg):
+        if self.stats is None:
+            self.stats = [None] * len(stat_positions)
+        self.stats[stat_positions["Avg " + col]] = avg
+        self.stats[stat_positions["Avg15 " + col]] = recent_avg
+
+    # Names of all the columns this run has
+    def keys(self):
+        cols = list(run_attrs)
+        if self.stats is not None:
+            cols.append("Q Rate")
+            cols.extend(c for (c, i) in stat_positions.items() if self.stats[i] is not None)
+        return cols
+
+    # (column, text) pairs of all the columns this run has
+    def items(self):
+        return [(c, self.get(c)) for c in self.keys()]
+
+    # All the values of this run, for hashing
+    def fields(self):
+        values = [getattr(self, a) for a in self.__slots__]
+        values[-1] = tuple(self.stats) if self.stats is not None else None
+        return tuple(values)
+
+# Format a number for the report: whole numbers without decimals, empty for None
+def format_number(value):
+    if value is None:
+        return ''
+    if value == int(value):
+        return str(int(value))
+    return str(value)
+
+# Format YPS with 2 decimals, as in the PPT export
+def format_yps(value):
+    return '' if value is None else '%.2f' % value
+
+# Format the fault counts as one text column
+# For example R=1, W=2, other fault=0 becomes 'R,2W'
+# Memoized, as most runs have one of a few combinations of faults
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def format_faults(faults):
+    text = []
+    for (name, count) in zip(fault_names, faults):
+        if count == 1:
+            text.append(name)
+        elif count:
+            text.append(str(count) + name)
+    return ','.join(text)
+
+# Functions to format the Run columns that are not plain text
+column_formats = {
+    "Date": lambda d: format_date(d),
+    "YPS": format_yps,
+    "Faults": format_faults,
+    "Score": format_number,
+    "MACH Pts": format_number,
+    "T2B Pts": format_number,
+}
+
+# Parses a date in FORMAT_DATE into a date object
+# The common zero padded MM/DD/YYYY form is split by position, which is much faster
+# than strptime(); anything else falls back to strptime(). Results are memoized since
+# every run on the same day has the same date string.
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(text):
+    if len(text) == 10 and text[2] == '/' and text[5] == '/' and text[:2].isdigit() \
+            and text[3:5].isdigit() and text[6:].isdigit():
+        return datetime.date(int(text[6:]), int(text[:2]), int(text[3:5]))
+    return datetime.datetime.strptime(text, FORMAT_DATE).date()
+
+# Formats a date object in FORMAT_DATE, memoized like parse_date()
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def format_date(date):
+    return date.strftime(FORMAT_DATE)
+
+# Converts CSV text to a float, or None if it is empty (or not a number)
+def to_float(text):
+    try:
+        return float(text) if text else None
+    except ValueError:
+        return None
+
+# Converts a fault count from CSV text to an int (empty counts as 0)
+def to_count(text):
+    return int(text) if text.isdigit() else 0
+
+# Converts the texts of the fault counts (in the order of fault_names) to a tuple of ints
+# Memoized, so the runs with the same faults also share one tuple
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def fault_counts(*texts):
+    return tuple(map(to_count, texts))
+
+# Reads a CSV input file into a list of Run using the column headings 
+# With an ingest directory, only the rows appended since the last run are parsed
+# With a RunSelection, only the selected rows are made into Runs (and a file of a source
+# that is not selected is not read at all)
+def read_csv(file, csv_cols, source, ingest_dir=None, selection=None):
+    if selection and not selection.selects_source(source):
+        log.info('Skipping %s (%s is not selected)', file, source)
+        return ([], make_file_meta(file, source, 0, DEFAULT_DATE))
+    log.info('Reading %s', file)
+    if ingest_dir:
+        # the snapshot has all the rows, so the selection is made after it is read
+        runs = read_csv_incremental(file, csv_cols, source, ingest_dir)
+        if selection:
+            runs = [run for run in runs if selection.selects_run(run)]
+    else:
+        with open(file, newline='', mode='r', encoding='utf-8-sig') as f:
+            # skip the header line
+            f.readline( )
+            # read the remainder of the file as CSV rows
+            runs = parse_csv_rows(csv.reader(f), csv_cols, source, selection)
+    run_count = len(runs)
     last_run_date = DEFAULT_DATE
-    print('Reading', file)
-    with open(file, newline='', mode='r', encoding='utf-8-sig') as f:
-        # skip the header line
-        f.readline( )
-        # read the remainder of the file as CSV rows
-        reader = csv.reader(f)
-        for row in reader:
-            # Reader returns a list of string for each CSV row
-            # Convert each CSV row to dict with column names as key
-            if len(row) > 5:
-                run = dict()
-                # mark the source of this run
-                run['Source'] = source
-                index = 0
-                for c in csv_cols:
-                    run[c] = row[index]
-                    index += 1
-                    if c in ("Date", "Trial Date"):
-                        # parse the date field into a date object
-                        d = datetime.datetime.strptime(run[c], FORMAT_DATE).date()
-                        run["SortDate"] = d
-                        if d > last_run_date:
-                            last_run_date = d
-                runs.append(run)
-                run_count += 1
-    print (run_count, 'lines read.')
-    print ("Last run", last_run_date.strftime(FORMAT_DATE))
+    for run in runs:
+        if run.date > last_run_date:
+            last_run_date = run.date
+    return (runs, make_file_meta(file, source, run_count, last_run_date))
+
+# Creates the meta data (for the source file table) of a CSV input file
+def make_file_meta(file, source, run_count, last_run_date):
+    log.info('%d lines read.', run_count)
+    log.info('Last run %s', last_run_date.strftime(FORMAT_DATE))
 
     # get the modification date/time of the file
     os_date = os.path.getmtime(file)
     file_date = datetime.datetime.fromtimestamp(os_date)
     print_date = file_date.strftime(FORMAT_DATE_TIME)
-    print ("File Date", print_date)
+    log.info('File Date %s', print_date)
   
     file_meta = dict()
     file_meta['Source'] = source
@@ -150,9 +455,178 @@ def read_csv(file, csv_cols, source):
     file_meta['Run Count'] = str(run_count)
     file_meta['File Date'] = file_date.strftime(FORMAT_DATE_TIME)
     file_meta['Last Run Date'] = last_run_date.strftime(FORMAT_DATE)
-    return (runs, file_meta)
+    return file_meta
+
+# Reads a CSV input file as a stream of runs, one row at a time (for --stream)
+# The meta data of the file is added to file_meta once the last row is read
+def iter_csv(file, csv_cols, source, file_meta, selection=None):
+    if selection and not selection.selects_source(source):
+        log.info('Skipping %s (%s is not selected)', file, source)
+        file_meta.update(make_file_meta(file, source, 0, DEFAULT_DATE))
+        return
+    log.info('Reading %s', file)
+    run_count = 0
+    last_run_date = DEFAULT_DATE
+    with open(file, newline='', mode='r', encoding='utf-8-sig') as f:
+        # skip the header line
+        f.readline( )
+        for run in iter_csv_rows(csv.reader(f), csv_cols, source, selection):
+            run_count += 1
+            if run.date > last_run_date:
+                last_run_date = run.date
+            yield run
+    file_meta.update(make_file_meta(file, source, run_count, last_run_date))
+
+# Converts CSV rows (lists of strings) into a list of Run using the column headings
+def parse_csv_rows(rows, csv_cols, source, selection=None):
+    return list(iter_csv_rows(rows, csv_cols, source, selection))
+
+# Converts CSV rows (lists of strings) into Runs using the column headings, one at a time
+# With a RunSelection, the rows that are not selected are skipped before they are mapped
+def iter_csv_rows(rows, csv_cols, source, selection=None):
+    map_row = source_mappers[source]
+    # position of each column in a row
+    index = {c: i for (i, c) in enumerate(csv_cols)}
+    if selection is None:
+        for row in rows:
+            # Reader returns a list of string for each CSV row
+            if len(row) > 5:
+                yield map_row(row, index)
+        return
+    selects_row = selection.row_filter(source, index)
+    for row in rows:
+        if len(row) > 5 and selects_row(row):
+            run = map_row(row, index)
+            if selection.selects_run(run):
+                yield run
+
+# Reads a CSV file, parsing only the rows appended to it since the last run
+# The parsed rows are saved in a snapshot in ingest_dir along with the byte offset
+# where they end and a hash of all the bytes before that offset. If any of those bytes
+# changed (such as a corrected row), or the file is shorter, it is fully parsed again.
+# Hashing the rows is still far quicker than parsing them.
+# A last line without a newline may still be growing, so it is parsed but not saved.
+def read_csv_incremental(file, csv_cols, source, ingest_dir):
+    os.makedirs(ingest_dir, exist_ok=True)
+    name = hashlib.sha256(os.path.abspath(file).encode('utf-8')).hexdigest()[:16]
+    snapshot_file = os.path.join(ingest_dir, source + '-' + name + '.pickle')
+    snapshot = None
+    if os.path.exists(snapshot_file):
+        with open(snapshot_file, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot.get('Version') != INGEST_VERSION or snapshot.get('Columns') != csv_cols:
+            snapshot = None
+    with open(file, 'rb') as f:
+        if snapshot and os.path.getsize(file) >= snapshot['Offset'] and file_check(f, snapshot['Offset']) == snapshot['Check']:
+            runs = snapshot['Runs']
+            start = snapshot['Offset']
+            log.info('  %d rows from %s', len(runs), snapshot_file)
+        else:
+            if snapshot:
+                log.info('  File was changed; reading all rows')
+            runs = []
+            # skip the header line
+            f.seek(0)
+            f.readline()
+            start = f.tell()
+        f.seek(start)
+        data = f.read()
+        # only complete lines are saved in the snapshot
+        end = data.rfind(b'\n') + 1
+        new_runs = parse_csv_bytes(data[:end], csv_cols, source)
+        runs.extend(new_runs)
+        offset = start + end
+        if new_runs or not snapshot:
+            snapshot = {'Version': INGEST_VERSION, 'Columns': csv_cols, 'Offset': offset, 'Check': file_check(f, offset), 'Runs': runs}
+            with open(snapshot_file + '.tmp', 'wb') as out:
+                pickle.dump(snapshot, out, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(snapshot_file + '.tmp', snapshot_file)
+    log.info('  %d new rows parsed', len(new_runs))
+    # add the incomplete last line (if any) without saving it
+    return runs + parse_csv_bytes(data[end:], csv_cols, source)
+
+# Converts the raw bytes of CSV rows into a list of Run using the column headings
+def parse_csv_bytes(data, csv_cols, source):
+    text = io.StringIO(data.decode('utf-8'), newline='')
+    return parse_csv_rows(csv.reader(text), csv_cols, source)
+
+# Hash of the bytes of a file before an offset, to detect a changed or rewritten file
+def file_check(f, offset):
+    f.seek(0)
+    h = hashlib.sha256()
+    remaining = offset
+    while remaining > 0:
+        chunk = f.read(min(remaining, INGEST_CHECK_CHUNK))
+        if not chunk:
+            break
+        h.update(chunk)
+        remaining -= len(chunk)
+    return h.hexdigest()
+
+# Position of a source in source_cols, to put the runs of PPT files before those of FTR files
+def source_order(source):
+    return list(source_cols).index(source)
+
+# Detects the source of a CSV file from its header line, or None if it is neither PPT nor FTR
+def detect_source(file):
+    with open(file, newline='', mode='r', encoding='utf-8-sig') as f:
+        header = [c.strip() for c in next(csv.reader(f), [])]
+    for (source, csv_cols) in source_cols.items():
+        if header[:len(csv_cols)] == csv_cols:
+            return source
+    return None
+
+# Finds the CSV files of a list of paths for a bulk ingest (--input)
+# Each path is a CSV file, a directory (all the *.csv files in it and its subdirectories)
+# or a glob pattern. Returns each file once, sorted by name within each path.
+def find_csv_files(paths):
+    files = dict()
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(glob.escape(path), '**', '*.csv'), recursive=True)
+        elif os.path.exists(path):
+            found = [path]
+        else:
+            found = glob.glob(path, recursive=True)
+        if not found:
+            log.warning('No CSV files found for %s', path)
+        for file in sorted(found):
+            files[file] = True
+    return list(files)
+
+# The files of find_csv_files() that are PPT or FTR exports (see detect_source()), without
+# the other CSV files in the same folders, such as the dumps and leaderboard of a report
+# A file that cannot be read (removed, or not text) is left out too
+def find_source_files(paths):
+    files = []
+    for file in find_csv_files(paths):
+        try:
+            if detect_source(file):
+                files.append(file)
+        except (OSError, ValueError):
+            pass
+    return files
+
+# Reads one CSV file of a bulk ingest, with its source detected from its header
+# Returns the runs and the meta data of the file, or None if it is not a PPT or FTR export
+def read_source_csv(file, ingest_dir=None, selection=None):
+    source = detect_source(file)
+    if source is None:
+        return None
+    return read_csv(file, source_cols[source], source, ingest_dir, selection)
+
+# Key of a run that is the same in every export it appears in, to find runs that are
+# in the exports of several handlers: the PPT Run ID, or else the date, dog, level & class
+# text of the export (not the level & class, which are '' for the ones not recognized),
+# trial number and judge of the run
+def run_key(run):
+    if run.run_id:
+        return run.run_id
+    return (run.date, run.dog, run.class_text, run.trial_num, run.judge)
 
 # Gets the agility level from a string that contains the level name
+# The level and class lookups are memoized, as an export only has a few distinct texts
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def get_level(text):
     level = ''
     for l in levels:
@@ -165,6 +639,7 @@ def get_level(text):
     return level
 
 # Gets the agility class from a string that contains the class name
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def get_class(text):
     agility_class = ''
     for c in classes:
@@ -173,48 +648,82 @@ def get_class(text):
             break
     return agility_class
 
-# Maps PawPrintTrials column names into the preferred names
-def map_ppt_columns(runs):
-    for run in runs:
-        # the 'Trial' field is actually the Club Name
-        run['Club'] = run.get('Trial','')
-        # 2 trials on same day are marked #1 and #2 in the 'Class' field
-        # single trial on a day has neither #1 or #2, so default to #1
-        run['Trial Num'] = '2' if '#2' in run.get('Class','') else '1'
-        # Define level & class by their simple name.
-        # PPT 'Class' includes both the level and class
-        ppt_class = run.get('Class','')
-        run['PPT Class'] = ppt_class
-        run['Level'] = get_level(ppt_class)
-        run['Class'] = get_class(ppt_class)
-
-# Maps FeelTheRushTrials column names into the preferred names
-def map_ftr_columns(runs):
-    for run in runs:
-        # use 'Dog', not 'Dogname'
-        run['Dog'] = remove_html_tags(run.get('Dogname',''))
-        # Use 'Date', not 'Trial Date'
-        run['Date'] = run.get('Trial Date', DEFAULT_DATE)
-        # for 2 for trials on same day
-        run['Trial Num'] = run.get('Trial Day','1')
-        # use 'Results', not 'Qual', for Q and NQ
-        run['Result'] = run.get('Qual','')
-        # map the 'Points' field to 'MACH Pts', 'Score' and 'T2B Pts" based on class
-        pts = run.get('Points','0')
-        this_class = run.get('Class','')
-        if this_class in ('JWW','Std'):
-            run['MACH Pts'] = pts
-        elif this_class == 'FAST':
-            run['Score'] = pts
-        elif this_class == 'T2B':
-            run['T2B Pts'] = pts
-        # Define level & classes by their common name
-        ftr_level = run.get('Level','')
-        run['FTR Level'] = ftr_level
-        run['Level'] = get_level(ftr_level)
-        ftr_class = run.get('Class','')
-        run['FTR Class'] = ftr_class
-        run['Class'] = get_class(ftr_class)
+# Gets the level, class and trial number of a PPT 'Class' text, such as 'Master Std #2'
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def classify_ppt_class(text):
+    # 2 trials on same day are marked #1 and #2 in the 'Class' field
+    # single trial on a day has neither #1 or #2, so default to #1
+    trial_num = '2' if '#2' in text else '1'
+    # PPT 'Class' includes both the level and class
+    return (get_level(text), get_class(text), trial_num)
+
+# Maps a PawPrintTrials CSV row into a Run with the preferred column names
+# Repeated text (names, clubs, judges, ...) is interned so all runs share one copy
+def map_ppt_row(row, index):
+    run = Run("PawPrint")
+    # parse the date field into a date object
+    run.date = parse_date(row[index["Date"]])
+    # the 'Trial' field is actually the Club Name
+    run.club = sys.intern(row[index["Trial"]])
+    run.location = sys.intern(row[index["Location"]])
+    run.dog = sys.intern(row[index["Dog"]])
+    run.handler = sys.intern(row[index["Handler"]])
+    run.judge = sys.intern(row[index["Judge"]])
+    # Define level & class by their simple name, and the trial number of the day
+    run.class_text = sys.intern(row[index["Class"]])
+    (run.level, run.agility_class, run.trial_num) = classify_ppt_class(run.class_text)
+    run.yards = row[index["Yards"]]
+    run.sct = row[index["SCT"]]
+    run.time = row[index["Time"]]
+    run.yps = to_float(row[index["YPS"]])
+    run.faults = fault_counts(row[index["R"]], row[index["S"]], row[index["W"]],
+                              row[index["T"]], row[index["F"]], row[index["E"]])
+    run.score = to_float(row[index["Score"]])
+    run.result = sys.intern(row[index["Result"]])
+    run.place = sys.intern(row[index["Place"]])
+    run.mach_pts = to_float(row[index["MACH Pts"]])
+    run.t2b_pts = to_float(row[index["T2B Pts"]])
+    run.top25 = sys.intern(row[index["Top25"]])
+    run.run_id = row[index["Run ID"]]
+    return run
+
+# Maps a FeelTheRushTrials CSV row into a Run with the preferred column names
+def map_ftr_row(row, index):
+    run = Run("FeelTheRush")
+    # use 'Dog', not 'Dogname'
+    run.dog = ftr_dog_name(row[index["Dogname"]])
+    # Use 'Date', not 'Trial Date'
+    run.date = parse_date(row[index["Trial Date"]])
+    run.club = sys.intern(row[index["Club"]])
+    # for 2 for trials on same day
+    run.trial_num = sys.intern(row[index["Trial Day"]])
+    run.judge = sys.intern(row[index["Judge"]])
+    run.sct = row[index["SCT"]]
+    run.time = row[index["Time"]]
+    # use 'Results', not 'Qual', for Q and NQ
+    run.result = sys.intern(row[index["Qual"]])
+    # map the 'Points' field to 'MACH Pts', 'Score' and 'T2B Pts" based on class
+    pts = to_float(row[index["Points"]])
+    ftr_class = row[index["Class"]]
+    if ftr_class in ('JWW','Std'):
+        run.mach_pts = pts
+    elif ftr_class == 'FAST':
+        run.score = pts
+    elif ftr_class == 'T2B':
+        run.t2b_pts = pts
+    # Define level & classes by their common name
+    run.class_text = sys.intern(row[index["Level"]] + ' ' + ftr_class)
+    run.level = get_level(row[index["Level"]])
+    run.agility_class = get_class(ftr_class)
+    return run
+
+# Function to map a CSV row into a Run for each source
+source_mappers = {"PawPrint": map_ppt_row, "FeelTheRush": map_ftr_row}
+
+# The dog name of an FTR 'Dogname' text (which may be a link), memoized
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def ftr_dog_name(text):
+    return sys.intern(remove_html_tags(text))
 
 # Removes HTML tags from a text string
 def remove_html_tags(text):
@@ -230,113 +739,693 @@ def remove_html_tags(text):
 
 # Remove absence runs 
 def remove_absences(runs):
-        runs[:] = [r for r in runs if not r.get("Result") == 'A']
+        runs[:] = [r for r in runs if not r.result == 'A']
 
 # For convenience, create 'Group' field = level & class
 def group_level_and_class(runs):
     for run in runs:
-        level = run.get('Level','')
-        agility_class = run.get('Class','')
-        #Special Case: T2B has no level
-        if agility_class == 'T2B':
-            group = agility_class
-        else:
-            group = level + ' ' + agility_class
-        # Filter our=t unwanted groups (for now) as 'Other'
-        # TODO: Remove this check when future dog class list is implemented
-        if group not in groups:
-            group = "Other"
-        run['Group'] = group
+        group_run(run)
+
+# Create the 'Group' field of one run
+def group_run(run):
+    run.group = run_group(run)
+
+# The group of a run, from its level & class
+def run_group(run):
+    return level_class_group(run.level, run.agility_class)
+
+# The group of a level & class, memoized
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def level_class_group(level, agility_class):
+    #Special Case: T2B has no level
+    if agility_class == 'T2B':
+        group = agility_class
+    else:
+        group = level + ' ' + agility_class
+    # Filter our=t unwanted groups (for now) as 'Other'
+    # TODO: Remove this check when future dog class list is implemented
+    if group not in groups:
+        group = "Other"
+    return group
 
 # Creates a reverse sorted list of unique dog names
 def group_dogs(runs):
-    print('Grouping Dogs')
+    log.info('Grouping Dogs')
     dogs = set()
     for run in runs:
-        if run.get('Dog', False):
-            dogs.add(run.get('Dog'))
+        if run.dog:
+            dogs.add(run.dog)
     dogs = list(dogs)
     dogs.sort(reverse=True)
     return dogs
 
-# Merge fault count columns into one text column
-# For example R=1, W=2, other fault=0 becomes 'R,2W'
-def merge_faults(runs):
-    print('Merging Faults')
+# Partition the runs into lists by (dog, group), keeping the date order of runs
+# Built once so the stats, tables, plots and NAC points don't rescan all runs
+def partition_runs(runs):
+    log.info('Partitioning Runs')
+    partitions = dict()
     for run in runs:
-        faults = []
-        for f in ("R","S","W","T","F","E"):
-            if run.get(f) == '1':
-                faults.append(f) 
-            elif run.get(f,'0') != '0':
-                faults.append(run.get(f,'0') + f)
-        run['Faults'] = ','.join(faults)
+        key = (run.dog, run.group)
+        if key not in partitions:
+            partitions[key] = []
+        partitions[key].append(run)
+    return partitions
+
+# Clean up a stream of runs one at a time (for --stream)
+# Does the same as the list versions: remove absences & group
+def clean_runs(runs):
+    for run in runs:
+        if run.result == 'A':
+            continue
+        group_run(run)
+        yield run
+
+# Columns of the dog name and the date in the CSV rows of each source
+source_key_cols = {"PawPrint": ("Dog", "Date"), "FeelTheRush": ("Dogname", "Trial Date")}
+
+# A selection of the runs to report (--dog, --group, --source, --since and --until)
+# Each criterion that is None selects everything. The dogs and the last date are checked
+# on the CSV rows before they are made into Runs, and the groups once a Run has its level
+# and class. The runs before the first date are still needed, as the running averages of
+# the selected runs depend on them: they are read (or, from a RunStore, only those since
+# the start of the season, with the averages continued from its StatsCheckpoints) and are
+# left out of the report by select_since() once the stats are calculated.
+class RunSelection:
+    def __init__(self, dogs=None, groups=None, sources=None, since=None, until=None):
+        self.dogs = set(dogs) if dogs else None
+        self.groups = set(groups) if groups else None
+        self.sources = set(sources) if sources else None
+        self.since = since
+        self.until = until
+
+    # True if the runs of a source are selected
+    def selects_source(self, source):
+        return self.sources is None or source in self.sources
+
+    # Function that tells if a CSV row of a source is selected (by dog and last date)
+    # The positions of the columns in the row are in index
+    def row_filter(self, source, index):
+        (dog_col, date_col) = source_key_cols[source]
+        dog_pos = index[dog_col]
+        date_pos = index[date_col]
+        # FTR dog names are cleaned of HTML tags by map_ftr_row()
+        dog_name = ftr_dog_name if source == "FeelTheRush" else str
+        def selects_row(row):
+            if self.dogs is not None and dog_name(row[dog_pos]) not in self.dogs:
+                return False
+            return self.until is None or parse_date(row[date_pos]) <= self.until
+        return selects_row
+
+    # True if a run is selected (not checking the first date)
+    def selects_run(self, run):
+        return ((self.dogs is None or run.dog in self.dogs)
+                and (self.sources is None or run.source in self.sources)
+                and (self.until is None or run.date <= self.until)
+                and (self.groups is None or run_group(run) in self.groups))
+
+    # The partitions with only the runs since the first date, once their stats are calculated
+    # The NumPy stats are written into the runs first, as they go by the position of each run
+    def select_since(self, partitions, numpy_stats):
+        if self.since is None:
+            return partitions
+        for (key, table_stats) in numpy_stats.items():
+            write_stats(partitions[key], table_stats)
+        numpy_stats.clear()
+        selected = dict()
+        for (key, table_runs) in partitions.items():
+            # the runs are in date order
+            first = bisect.bisect_left([run.date for run in table_runs], self.since)
+            if first < len(table_runs):
+                selected[key] = table_runs[first:]
+        return selected
+
+# Spills runs to one file per dog, so that each dog can be loaded on its own (for --stream)
+# Only a limited number of the files are kept open at one time
+class DogSpill:
+    def __init__(self, directory, max_open=64):
+        self.directory = directory
+        self.max_open = max_open
+        self.paths = dict()
+        self.open_files = collections.OrderedDict()
+
+    # Append a run to the file of its dog
+    def add(self, run):
+        dog = run.dog
+        # runs with no dog are never reported
+        if not dog:
+            return
+        f = self.open_files.pop(dog, None)
+        if f is None:
+            if dog not in self.paths:
+                self.paths[dog] = os.path.join(self.directory, str(len(self.paths)) + '.pickle')
+            if len(self.open_files) >= self.max_open:
+                self.open_files.popitem(last=False)[1].close()
+            f = open(self.paths[dog], 'ab')
+        # keep the open files in least to most recently used order
+        self.open_files[dog] = f
+        pickle.dump(run, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        for f in self.open_files.values():
+            f.close()
+        self.open_files.clear()
+
+    # Reverse sorted list of the dog names, the same as group_dogs()
+    def dogs(self):
+        return sorted(self.paths, reverse=True)
+
+    # Load the runs of one dog, in the order they were added
+    def load(self, dog):
+        runs = []
+        with open(self.paths[dog], 'rb') as f:
+            while True:
+                try:
+                    runs.append(pickle.load(f))
+                except EOFError:
+                    break
+        return runs
+
+# Running average of a stream of values, updated in constant time per value.
+# Keeps the sum of all values for the average and a ring buffer of the last
+# 'window' values for the trailing average. Sums are kept exact so the results match
+# statistics.mean(), including returning an int when all values are ints and the
+# average is a whole number. Every float is an integer over a power of 2, so the values
+# are kept as integers scaled by 2**shift (the largest power of 2 of a float so far):
+# adding ints is much quicker than adding Fractions, and dividing two ints gives the
+# correctly rounded mean.
+class RunningAverage:
+    def __init__(self, window):
+        self.window = window
+        self.ring = [0] * window
+        self.ring_floats = [False] * window
+        self.count = 0
+        self.shift = 0
+        self.total = 0
+        self.float_count = 0
+        self.recent_total = 0
+        self.recent_float_count = 0
+
+    # Add the next value to the running sums
+    def add(self, value):
+        is_float = isinstance(value, float)
+        if is_float:
+            (numerator, denominator) = value.as_integer_ratio()
+            bits = denominator.bit_length() - 1
+            if bits > self.shift:
+                self.rescale(bits)
+            value = numerator << (self.shift - bits)
+        else:
+            value <<= self.shift
+        # drop the oldest value from the window once it is full
+        slot = self.count % self.window
+        if self.count >= self.window:
+            self.recent_total -= self.ring[slot]
+            if self.ring_floats[slot]:
+                self.recent_float_count -= 1
+        self.ring[slot] = value
+        self.ring_floats[slot] = is_float
+        self.recent_total += value
+        self.total += value
+        if is_float:
+            self.float_count += 1
+            self.recent_float_count += 1
+        self.count += 1
+
+    # Scale the sums & values up to 2**shift
+    def rescale(self, shift):
+        bits = shift - self.shift
+        self.total <<= bits
+        self.recent_total <<= bits
+        self.ring = [value << bits for value in self.ring]
+        self.shift = shift
+
+    # Mean of a scaled sum of count values, the same as exact_mean()
+    def mean(self, total, count, all_ints):
+        divisor = count << self.shift
+        if all_ints and total % divisor == 0:
+            return total // divisor
+        return total / divisor
+
+    # Average of all values so far
+    def avg(self):
+        return self.mean(self.total, self.count, self.float_count == 0)
+
+    # Average of the last 'window' values
+    def recent_avg(self):
+        return self.mean(self.recent_total, min(self.count, self.window), self.recent_float_count == 0)
+
+    # The running sums as a tuple (that can be pickled), to continue from with from_state()
+    def state(self):
+        return (self.window, tuple(self.ring), tuple(self.ring_floats), self.count, self.shift,
+                self.total, self.float_count, self.recent_total, self.recent_float_count)
+
+    # A RunningAverage that continues from a state()
+    @classmethod
+    def from_state(cls, state):
+        history = cls(state[0])
+        (history.window, ring, ring_floats, history.count, history.shift, history.total,
+         history.float_count, history.recent_total, history.recent_float_count) = state
+        history.ring = list(ring)
+        history.ring_floats = list(ring_floats)
+        return history
+
+# Converts an exact sum into a mean the same way statistics.mean() does
+def exact_mean(total, count, all_ints):
+    mean = Fraction(total, count)
+    if all_ints and mean.denominator == 1:
+        return mean.numerator
+    return float(mean)
+
+# The value a run adds to the running averages of a stat column, or None if it adds none
+def stat_value(run, col):
+    # Q Rate is computed for all runs; other stats only for the Q runs
+    if col == "Q Rate":
+        # Use 100 or 0 for Q or NQ to report average result in percent
+        return 100 if run.result == "Q" else 0
+    if run.result != "Q":
+        return None
+    value = run.value(col)
+    # an empty value counts as 0 (an int, unlike a float 0.0)
+    return 0 if value is None else value
 
 # Calculate the statistics (running averages) for specific columns for all runs
-# The calculated stats are added as new 'columns' to the run dictionary as text strings
-# NQ runs are assigned an empty string
-def calc_stats(runs, dogs, groups):
-    print('Calculating stats')
-    stat_cols = ["Q Rate", "YPS", "Score", "MACH Pts", "T2B Pts"]
+# The calculated stats are set in each run with Run.set_stats()
+# NQ runs have no stats (except Q Rate)
+# The averages of a (dog, group) continue from its RunningAverages in histories, if any
+# (the averages of the runs before the first one in the partition, see StatsCheckpoints)
+def calc_stats(partitions, dogs, groups, histories=None):
+    log.info('Calculating stats')
     for dog in dogs:
-        print('  Dog:', dog)
+        log.debug('  Dog: %s', dog)
         for group in groups:
-            print('    Stats:', dog, group)
-            table_runs = [run for run in runs if run.get('Dog')==dog and run.get('Group')==group]
-            for col in stat_cols:
-                # history is a running list of values for this stat column
-                history = list()
+            log.debug('    Stats: %s %s', dog, group)
+            table_runs = partitions.get((dog, group), [])
+            start = histories.get((dog, group), dict()) if histories else dict()
+            for col in group_stat_cols[group]:
+                # running averages of the values for this stat column
+                history = start.get(col) or RunningAverage(stat_windows[col])
                 for run in table_runs:
-                    # Q Rate is computed for all runs; other stats only for the Q runs
-                    if col == "Q Rate" or run.get("Result") == "Q":
-                        # Use 100 or 0 for Q or NQ to report average result in percent
-                        if col == "Q Rate":
-                            value = 100 if run.get("Result") == "Q" else 0
-                            # save the Q or NQ as a value of 0 or 10 for sane plotting
-                            run["Q Rate"] = value / 10 
-                        else:
-                            value = float(run.get(col)) if run.get(col) else 0
-                        # append this value to the running list of values for this class
-                        history.append(value)
-                        # compute average of *all* values up to this point
-                        run["Avg " + col] = str(round(statistics.mean(history),2))
-                        # compute average of last 15 values
-                        run["Avg15 " + col] = str(round(statistics.mean(history[-15:]),2))
-                    else:
-                        # No stats for NQ runs (except Q-Rate)
-                        run["Avg " + col] = ''
-                        run["Avg15 " + col] = ''
-    return stat_cols
-
-# Calulate the MACH Pts for National Agility Championship (NAC)
-def calc_nac_points(runs, dog, year):
-    nac_groups = ("Master Std", "Master JWW")
-    nac_runs = [run for run in runs if run.get('Dog')==dog and run.get('Group') in nac_groups]
-    # NAC year runs from Dec 1 to Nov 30
-    nac_start_date = datetime.datetime(year-2, 12, 1, 0, 0).date()
-    nac_end_date   = datetime.datetime(year-1, 11, 30, 0, 0).date()
-    nac_points = 0
-    for run in nac_runs:
-        if nac_start_date <= run.get('SortDate') and  run.get('SortDate') <= nac_end_date:
-            pts = int(run.get('MACH Pts',0)) if run.get('MACH Pts') else 0
-            # remove negative MACH points
-            if pts > 0:
-                nac_points += pts
+                    value = stat_value(run, col)
+                    if value is not None:
+                        # add this value to the running averages for this class
+                        history.add(value)
+                        # average of *all* values up to this point, and
+                        # average of the most recent values (last 15 by default)
+                        run.set_stats(col, history.avg(), history.recent_avg())
+
+# Calculate the same statistics as calc_stats() using NumPy arrays, one (dog, group) at a time
+# Each stat column is loaded into an array and averaged with cumulative sums. The results
+# are kept as arrays until write_stats() sets them in the runs
+# The averages continue from the histories like calc_stats()
+def calc_stats_numpy(partitions, dogs, groups, histories=None):
+    log.info('Calculating stats (NumPy)')
+    stats = dict()
+    for dog in dogs:
+        log.debug('  Dog: %s', dog)
+        for group in groups:
+            table_runs = partitions.get((dog, group), [])
+            if not table_runs:
+                continue
+            start = histories.get((dog, group), dict()) if histories else dict()
+            is_q = [run.result == "Q" for run in table_runs]
+            table_stats = dict()
+            for col in group_stat_cols[group]:
+                if col == "Q Rate":
+                    # Q Rate is computed for all runs, as 100 or 0 for Q or NQ
+                    values = [100 if q else 0 for q in is_q]
+                    mask = np.ones(len(table_runs), dtype=bool)
+                else:
+                    # other stats only for the Q runs
+                    values = [run.value(col) for run, q in zip(table_runs, is_q) if q]
+                    values = [0 if v is None else v for v in values]
+                    mask = np.array(is_q, dtype=bool)
+                table_stats[col] = (mask,) + running_averages_numpy(values, stat_windows[col], start.get(col))
+            stats[(dog, group)] = table_stats
+    return stats
+
+# Running averages of a list of numbers using NumPy, with the same results as RunningAverage
+# Returns the average of all values so far and the average of the last 'window' values,
+# each as a (means, is_int) pair of arrays
+# The averages continue from a RunningAverage of the values before these, if there is one
+def running_averages_numpy(values, window, history=None):
+    counts = np.arange(1, len(values) + 1)
+    recent_counts = np.minimum(counts, window)
+    data = np.array(values, dtype=np.float64)
+    scale = fixed_point_scale(data)
+    if scale is None or history is not None:
+        # values can't be summed exactly in fixed point (or continue from earlier sums),
+        # so use the exact engine; the runs after a checkpoint are only a few
+        history = history or RunningAverage(window)
+        avgs = []
+        recent_avgs = []
+        for value in values:
+            history.add(value)
+            avgs.append(history.avg())
+            recent_avgs.append(history.recent_avg())
+        return (exact_means_to_arrays(avgs), exact_means_to_arrays(recent_avgs))
+    # sum the values as exact integers: value * scale
+    totals = np.cumsum(np.rint(data * scale).astype(np.int64))
+    recent_totals = trailing_sums(totals, window)
+    # a mean can only be an int if all of its values are ints (as statistics.mean)
+    float_counts = np.cumsum(np.array([isinstance(v, float) for v in values], dtype=bool))
+    recent_float_counts = trailing_sums(float_counts, window)
+    avgs = fixed_point_means(totals, counts, scale, float_counts == 0)
+    recent_avgs = fixed_point_means(recent_totals, recent_counts, scale, recent_float_counts == 0)
+    # A mean within rounding error of a tie at 2 decimals (such as 4.015) rounds up or down
+    # depending on the exact binary value of each float, so recompute those exactly
+    avg_ties = rounding_ties(avgs)
+    recent_ties = rounding_ties(recent_avgs)
+    if avg_ties or recent_ties:
+        last = max(avg_ties + recent_ties)
+        (prefix, denominator) = exact_prefix_sums(data[:last+1])
+        for i in avg_ties:
+            set_exact_mean(avgs, i, prefix[i+1], denominator, i+1, float_counts[i] == 0)
+        for i in recent_ties:
+            start = max(0, i+1 - window)
+            set_exact_mean(recent_avgs, i, prefix[i+1] - prefix[start], denominator, i+1 - start, recent_float_counts[i] == 0)
+    return (avgs, recent_avgs)
+
+# Sums of the last 'window' values from an array of cumulative sums
+def trailing_sums(totals, window):
+    sums = totals.copy()
+    sums[window:] -= totals[:-window]
+    return sums
+
+# Finds the smallest power of 10 that turns all the values into exact integers
+# Returns None if there isn't one (up to 6 decimals) or the sums could overflow
+def fixed_point_scale(data):
+    for decimals in range(7):
+        scale = 10 ** decimals
+        fixed = np.rint(data * scale)
+        if np.all(fixed / scale == data):
+            # the sums must be exact as float64 as well as int64
+            if np.abs(fixed).sum() < 2 ** 53:
+                return scale
+            return None
+    return None
+
+# Means of fixed-point sums as a (means, is_int) pair of arrays
+# Dividing two exact integers gives the correctly rounded mean, as statistics.mean()
+def fixed_point_means(totals, counts, scale, all_ints):
+    divisors = counts * scale
+    means = totals / divisors
+    is_int = all_ints & (totals % divisors == 0)
+    return (means, is_int)
+
+# Converts a list of exact means from exact_mean() into a (means, is_int) pair of arrays
+def exact_means_to_arrays(means):
+    is_int = np.array([isinstance(m, int) for m in means], dtype=bool)
+    return (np.array(means, dtype=np.float64), is_int)
+
+# Finds the indexes of the means that are (nearly) a tie when rounded to 2 decimals
+def rounding_ties(means_is_int):
+    (means, is_int) = means_is_int
+    hundredths = means * 100
+    near_tie = np.abs(hundredths - np.floor(hundredths) - 0.5) < 1e-6
+    return np.nonzero(near_tie & ~is_int)[0].tolist()
+
+# Exact prefix sums of an array of floats as integers over a common power of 2 denominator
+def exact_prefix_sums(data):
+    # split each float into an exact 53 bit integer mantissa and a power of 2 exponent
+    (mantissas, exponents) = np.frexp(data)
+    mantissas = (mantissas * 2.0 ** 53).astype(np.int64)
+    nonzero = mantissas != 0
+    lowest = int(exponents[nonzero].min()) if nonzero.any() else 0
+    highest = int(exponents[nonzero].max()) if nonzero.any() else 0
+    if highest - lowest <= 9:
+        # shift all mantissas to the lowest exponent without overflowing int64
+        numerators = (mantissas << np.where(nonzero, exponents - lowest, 0)).tolist()
+        if lowest < 53:
+            denominator = 2 ** (53 - lowest)
+        else:
+            denominator = 1
+            numerators = [n << (lowest - 53) for n in numerators]
+    else:
+        ratios = [v.as_integer_ratio() for v in data.tolist()]
+        denominator = max(d for (n, d) in ratios)
+        numerators = [n * (denominator // d) for (n, d) in ratios]
+    return ([0] + list(itertools.accumulate(numerators)), denominator)
+
+# Replaces one mean in a (means, is_int) pair of arrays with its exact value
+def set_exact_mean(means_is_int, i, numerator, denominator, count, all_ints):
+    mean = exact_mean(Fraction(numerator, denominator), count, all_ints)
+    means_is_int[0][i] = mean
+    means_is_int[1][i] = isinstance(mean, int)
+
+# Convert a (means, is_int) pair of arrays into a list of numbers (int or float)
+def means_to_list(means_is_int):
+    (means, is_int) = means_is_int
+    return [int(m) if i else m for (m, i) in zip(means.tolist(), is_int.tolist())]
+
+# Set the NumPy stats of one (dog, group) in its runs, the same as calc_stats() does
+def write_stats(table_runs, table_stats):
+    for (col, (mask, avgs, recent_avgs)) in table_stats.items():
+        avgs = means_to_list(avgs)
+        recent_avgs = means_to_list(recent_avgs)
+        position = 0
+        for (run, has_stats) in zip(table_runs, mask.tolist()):
+            if has_stats:
+                run.set_stats(col, avgs[position], recent_avgs[position])
+                position += 1
+
+# Calculate the stats of all (dog, group) partitions with the STATS_BACKEND engine
+# Returns the NumPy stats to write into the runs with write_stats() (empty for 'python')
+# The averages continue from the histories (from StatsCheckpoints.histories()), if any
+def compute_stats(partitions, dogs, histories=None):
+    with profiler.stage('calc_stats'):
+        if STATS_BACKEND == 'numpy':
+            return calc_stats_numpy(partitions, dogs, groups, histories)
+        calc_stats(partitions, dogs, groups, histories)
+        return dict()
+
+# Year of the National Agility Championship (NAC) that a run on this date counts towards
+# For example the 2025 NAC counts the runs from Dec 1 2023 to Nov 30 2024
+def nac_year(date):
+    if (date.month, date.day) >= (nac_cutoff_month, nac_cutoff_day):
+        return date.year + 2
+    return date.year + 1
+
+# First and last date of the season of an NAC year
+def nac_season(year):
+    start = datetime.date(year - 2, nac_cutoff_month, nac_cutoff_day)
+    end = datetime.date(year - 1, nac_cutoff_month, nac_cutoff_day) - datetime.timedelta(days=1)
+    return (start, end)
+
+# The MACH points for the NAC of each dog by NAC year, built in one pass over the runs
+# Only the positive MACH points of the nac_groups count. The points of each dog are kept
+# as prefix sums over its seasons, so the points of any NAC year or span of years are
+# found in constant time. The seasons of a dog run from its first to its last run.
+class NacIndex:
+    def __init__(self, partitions, dogs):
+        self.first_year = dict()
+        self.prefix_sums = dict()
+        for dog in dogs:
+            # each partition is in date order, so its first & last run give the span of seasons
+            dog_runs = [partitions[(dog, group)] for group in groups if partitions.get((dog, group))]
+            if not dog_runs:
+                continue
+            first_year = nac_year(min(runs[0].date for runs in dog_runs))
+            last_year = nac_year(max(runs[-1].date for runs in dog_runs))
+            points = [0] * (last_year - first_year + 1)
+            for group in nac_groups:
+                for run in partitions.get((dog, group), []):
+                    pts = int(run.mach_pts) if run.mach_pts else 0
+                    # remove negative MACH points
+                    if pts > 0:
+                        points[nac_year(run.date) - first_year] += pts
+            self.first_year[dog] = first_year
+            self.prefix_sums[dog] = [0] + list(itertools.accumulate(points))
+
+    # The NAC years of a dog's seasons, in order
+    def years(self, dog):
+        if dog not in self.first_year:
+            return range(0)
+        first_year = self.first_year[dog]
+        return range(first_year, first_year + len(self.prefix_sums[dog]) - 1)
+
+    # Total MACH points of a dog for the NAC years first_year to last_year (inclusive)
+    def points(self, dog, first_year, last_year=None):
+        if last_year is None:
+            last_year = first_year
+        years = self.years(dog)
+        if not years:
+            return 0
+        first = min(max(first_year, years.start), years.stop) - years.start
+        last = min(max(last_year + 1, years.start), years.stop) - years.start
+        sums = self.prefix_sums[dog]
+        return sums[last] - sums[first] if last > first else 0
+
+# Row of the NAC Points table of a dog for one NAC year
+def nac_points_row(nac_index, dog, year):
+    (nac_start_date, nac_end_date) = nac_season(year)
     nac_run = dict()
     nac_run["Result"] = "Q"  # Required for Table CSS and filtering
     nac_run["NAC Year"] = str(year)
-    nac_run["Start Date"] = nac_start_date.strftime(FORMAT_DATE)
-    nac_run["End Date"] = nac_end_date.strftime(FORMAT_DATE)
-    nac_run["MACH Pts"] = str(nac_points)
+    nac_run["Start Date"] = format_date(nac_start_date)
+    nac_run["End Date"] = format_date(nac_end_date)
+    nac_run["MACH Pts"] = str(nac_index.points(dog, year))
     return nac_run
 
+# The totals of one dog in one group for the leaderboard
+# The averages are RunningAverages of the same stats as the dog's table of the group, so
+# they match its last averages and only keep the last 'window' values of each
+class LeaderboardEntry:
+    __slots__ = ('runs', 'qs', 'q_rates', 'yps', 'mach_pts', 'nac_points', 'top25')
+
+    def __init__(self, group):
+        self.runs = 0
+        self.qs = 0
+        self.q_rates = RunningAverage(stat_windows["Q Rate"])
+        # only the groups whose tables show the YPS have YPS averages
+        self.yps = RunningAverage(stat_windows["YPS"]) if "YPS" in group_stat_cols[group] else None
+        self.mach_pts = 0
+        # MACH points by NAC year
+        self.nac_points = collections.Counter()
+        self.top25 = 0
+
+    # Add the next run (in date order) to the totals
+    def add(self, run):
+        self.runs += 1
+        if run.result == "Q":
+            self.qs += 1
+        self.q_rates.add(stat_value(run, "Q Rate"))
+        if self.yps is not None:
+            value = stat_value(run, "YPS")
+            if value is not None:
+                self.yps.add(value)
+        pts = int(run.mach_pts) if run.mach_pts else 0
+        # remove negative MACH points
+        if pts > 0:
+            self.mach_pts += pts
+            self.nac_points[nac_year(run.date)] += pts
+        if run.top25:
+            self.top25 += 1
+
+    # The values of the leaderboard columns (None when there is no value), with the
+    # NAC MACH Pts of an NAC year and the MACH points of every NAC year by year
+    def values(self, dog, year):
+        (q_rate, recent_q_rate) = final_averages(self.q_rates)
+        (yps, recent_yps) = final_averages(self.yps)
+        return {
+            "Dog": dog,
+            "Runs": self.runs,
+            "Qs": self.qs,
+            "Avg Q Rate": q_rate,
+            "Avg15 Q Rate": recent_q_rate,
+            "Avg YPS": yps,
+            "Avg15 YPS": recent_yps,
+            "MACH Pts": self.mach_pts,
+            "NAC MACH Pts": self.nac_points[year],
+            "Top25": self.top25,
+            "NAC MACH Pts by Year": dict(sorted(self.nac_points.items())),
+        }
+
+# The average and trailing average of a RunningAverage (None if it has no values)
+def final_averages(history):
+    if history is None or not history.count:
+        return (None, None)
+    return (history.avg(), history.recent_avg())
+
+# Leaderboard of the dogs of each group, built in one pass over the runs
+# The runs are aggregated by (group, dog) as they go by, so each run is looked at once
+# however many dogs there are. The runs can be added in parts (one dog at a time with
+# --stream), as long as the runs of each dog are added in date order. The NAC MACH Pts
+# the dogs are ranked by are those of the NAC year given, or else of the last complete
+# season: the one before the season of the last run added, which may have just started.
+class Leaderboard:
+    def __init__(self, season=None):
+        self.entries = dict()
+        self.last_date = None
+        self.season = season
+
+    # Add runs (in date order) to the totals
+    # With a RunSelection only the selected runs are added, including the first date
+    def add(self, runs, selection=None):
+        entries = self.entries
+        last_date = self.last_date
+        for run in runs:
+            if selection and not (selection.selects_run(run) and (selection.since is None or run.date >= selection.since)):
+                continue
+            key = (run.group, run.dog)
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = LeaderboardEntry(run.group)
+            entry.add(run)
+            if last_date is None or run.date > last_date:
+                last_date = run.date
+        self.last_date = last_date
+
+    # NAC year of the season the NAC MACH Pts are of
+    def nac_year(self):
+        if self.season:
+            return self.season
+        return nac_year(self.last_date) - 1 if self.last_date else None
+
+    # All the NAC years from the first to the last season with MACH points, in order
+    def nac_years(self):
+        years = set(itertools.chain.from_iterable(entry.nac_points for entry in self.entries.values()))
+        return list(range(min(years), max(years) + 1)) if years else []
+
+    # The rows (dicts of column values) of a group's leaderboard, ranked by its sort column
+    # Dogs with fewer than LEADERBOARD_MIN_RUNS runs follow the ranked dogs, without a rank
+    def rows(self, group):
+        year = self.nac_year()
+        rows = [entry.values(dog, year) for ((g, dog), entry) in self.entries.items() if g == group]
+        sort_col = leaderboard_sort_cols[group]
+        # highest first, with the empty values last and then by dog name
+        rows.sort(key=lambda row: row["Dog"])
+        rows.sort(key=lambda row: (row[sort_col] is not None, row[sort_col] or 0, row["Avg15 Q Rate"], row["Runs"]), reverse=True)
+        ranked = [row for row in rows if row["Runs"] >= LEADERBOARD_MIN_RUNS]
+        for (rank, row) in enumerate(ranked, 1):
+            row["Rank"] = rank
+        return ranked + [row for row in rows if row["Runs"] < LEADERBOARD_MIN_RUNS]
+
+    # The groups that have dogs, in order (without the odd-ball classes, like the report)
+    def groups(self):
+        present = {g for (g, dog) in self.entries}
+        return [g for g in groups if g in present and g in leaderboard_sort_cols]
+
 # Convert a column name to its clean CSS class name
+@functools.lru_cache(maxsize=None)
 def col_css_class(c):
     return 'col-' + c.lower().replace(' ','-')
 
 # Convert a row name to its clean CSS class name
+@functools.lru_cache(maxsize=None)
 def row_css_class(r):
     return 'row-' + r.lower().replace(' ','-')
+
+# Escape text (a cell value, name or heading) for the HTML output
+# Most values have nothing to escape, which is quicker to check than to escape
+def escape_html(text):
+    if '&' in text or '<' in text or '>' in text:
+        return html.escape(text, quote=False)
+    return text
+
+# Build the template of a table row for a tuple of columns, once per tuple of columns
+# The template has one {} for the attributes of the row and one {} for each cell
+@functools.lru_cache(maxsize=None)
+def row_template(cols):
+    cells = []
+    for c in cols:
+        css = col_css_class(c).replace('{','{{').replace('}','}}')
+        cells.append('    <td class="' + css + '" >{}</td>\n')
+    return '  <tr{}>\n' + ''.join(cells) + '  </tr>\n'
+
+# Format a single table row with the template of its columns
+def format_table_row(template, cols, run):
+    result = run.get("Result","")
+    css_class = 'class="' + row_css_class(result) +'"' if result else ''
+    return template.format(' ' + css_class, *[escape_html(str(run.get(c, ''))) for c in cols])
+
+# Format the heading row of a table
+def format_table_heading(cols):
+    heading = ['  <thead>\n', '  <tr>\n']
+    for c in cols:
+        heading.append('    <th class="' + col_css_class(c) +'" >' + escape_html(c) + '</th>\n')
+    heading.append('  </tr>\n')
+    heading.append('  </thead>\n')
+    return ''.join(heading)
     
 # Write the header (including CSS) and main body start to the HTML output file
 def write_html_header(w):
@@ -383,35 +1472,28 @@ def write_html_footer(w):
     w.write('</html>\n')
 
 # Write a table of file meta data
-def write_file_table(file_metas):
-    print('  Source File Table')
+def write_file_table(w, file_metas):
+    log.debug('  Source File Table')
     cols = ['Source','Filename','Run Count','File Date','Last Run Date']
     now = datetime.datetime.now().strftime(FORMAT_DATE_TIME)
     w.write('<p><b>Report Date:</b> ' + now + '</p>\n')
     w.write('<h2>Source Files</h2>\n')
     w.write('<table>\n')
     # table heading
-    w.write('  <thead>\n')
-    w.write('  <tr>\n')
-    for c in cols:
-        w.write('    <th class="' + col_css_class(c) +'" >' + c + '</th>\n')
-    w.write('  </tr>\n')
-    w.write('  </thead>\n')
+    w.write(format_table_heading(cols))
     # table body
+    template = row_template(tuple(cols))
     w.write('  <tbody>\n')
     for meta in file_metas:
-        w.write('  <tr>\n')
-        for c in cols:
-            w.write('    <td class="' + col_css_class(c) +'" >' + meta[c] + '</td>\n')
-        w.write('  </tr>\n')
+        w.write(template.format('', *[escape_html(meta[c]) for c in cols]))
     w.write('  </tbody>\n')
     w.write('</table>\n')
 
 # Write a new section start to the HTML output file
 def write_section_header(w, dog):
-    print('  Section:', dog)
+    log.debug('  Section: %s', dog)
     w.write('<section>')
-    w.write('<h1>' + dog + '</h1>\n')
+    w.write('<h1>' + escape_html(dog) + '</h1>\n')
 
 # Write a section close to the HTML output file
 def write_section_footer(w):
@@ -419,190 +1501,1604 @@ def write_section_footer(w):
 
 # Write a new table start to the HTML output file
 def write_table_header(w, dog, group, cols):
-    print('    Table:', dog, group)
+    log.debug('    Table: %s %s', dog, group)
     # table heading row
-    w.write('<h2>' + dog + ' &ndash; ' + group + '</h2>\n')  
-    w.write('<div class="scroll-x">\n')
-    w.write('<table>\n')
-    w.write('  <thead>\n')
-    w.write('  <tr>\n')
-    for c in cols:
-        w.write('    <th class="' + col_css_class(c) +'" >' + c + '</th>\n')
-    w.write('  </tr>\n')
-    w.write('  </thead>\n')
+    w.write('<h2>' + escape_html(dog) + ' &ndash; ' + escape_html(group) + '</h2>\n'
+            '<div class="scroll-x">\n'
+            '<table>\n' + format_table_heading(cols))
 
-# Write a single table row to the HTML output file
-def write_table_row(w, cols, run):
-    # table body rows
-    result = run.get("Result","")
-    css_class = 'class="' + row_css_class(result) +'"' if result else ''
-    w.write('  <tr ' + css_class + '>\n')
-    for c in cols:
-        w.write('    <td class="' + col_css_class(c) +'" >' + str(run.get(c, '')) + '</td>\n')
-    w.write('  </tr>\n')
+# Write the table rows of many runs to the HTML output file, all with one write
+def write_table_rows(w, cols, runs):
+    template = row_template(tuple(cols))
+    w.write(''.join([format_table_row(template, cols, run) for run in runs]))
 
 # Write an table close to the HTML output file
 def write_table_footer(w):
     w.write('</table>\n')
     w.write('</div>\n')
 
+# Render a complete table (header, rows and footer) as a string
+def render_table(dog, group, cols, table_runs):
+    buffer = io.StringIO()
+    write_table_header(buffer, dog, group, cols)
+    write_table_rows(buffer, cols, table_runs)
+    write_table_footer(buffer)
+    return buffer.getvalue()
+
 # Write an SVG string (of a plot) with a headline to the HTML output file.
-def write_svg_plot(w, svg, col):
+def write_svg_plot(w, svg, dog, group, col):
     w.write('<div class="plot">\n')
-    w.write('<h2>' + dog + ' &ndash; ' + group+ ' &ndash; ' + col + '</h2>\n') 
+    w.write('<h2>' + escape_html(dog) + ' &ndash; ' + escape_html(group) + ' &ndash; ' + escape_html(col) + '</h2>\n')
     w.write(svg)
     w.write('</div>')
 
-# Create a plot (x-y graph) of the base column and its computed stats columns
-# Uses the date as the x-axis, groups in months
-# plot is converted to SVG and returned as a large python string
-def create_plot_as_svg(table_runs, base_col):
+# Collect the data to plot for the base column and its computed stats columns
+# Returns the legend labels, the dates (x-axis), a list of values (y-axis) for
+# each column and the max value for the y-axis
+def get_plot_data(table_runs, base_col):
     # create a list of columns to plott together
     plot_cols = [base_col, "Avg "+base_col, "Avg15 "+base_col ]
 
-    # create a blank plot to start with
-    plt.close('all')
-    fig, ax = plt.subplots()
-    # set size
-    fig.set_figheight(5)
-    fig.set_figwidth(18)
-
     # set default max value for Y-axis based on type of data
     # Note: this will be auto-adjusted higher if the data exceeds this limit
     y_maxes = {"Q Rate":100, "YPS":5, "Score":100, "MACH Pts":10, "T2B Pts":15}
     y_max = y_maxes[base_col]
-        
-    # plot y (value) vs x (date) for each column
+
+    # Q Rate is plotted for all runs; other stats only for the Q runs
+    plot_runs = [run for run in table_runs if base_col == "Q Rate" or run.result == "Q"]
+    # use the dates parsed when the runs were read (matplotlib takes date objects as is)
+    xdata = [run.date for run in plot_runs]
+    ydatas = []
     for col in plot_cols:
-        xdata = []
         ydata = []
-        for run in table_runs:
-            if base_col == "Q Rate" or run.get("Result") == "Q":
-                x = datetime.datetime.strptime(run["Date"], FORMAT_DATE)
-                y  = float(run.get(col,0)) if run.get(col) else 0
-                # do we need to adjust the max y value of the plot?
-                if y > y_max:
-                    # round up to next multiple of 5
-                    if (y/5) == int(y/5):
-                        y_max = y
-                    else:
-                        y_max = 5*(int(y/5)+1)
-                xdata.append(x)
-                ydata.append(y)
-        plt.plot(xdata,ydata,'o-')
+        for run in plot_runs:
+            y = run.value(col) or 0
+            # do we need to adjust the max y value of the plot?
+            if y > y_max:
+                # round up to next multiple of 5
+                if (y/5) == int(y/5):
+                    y_max = y
+                else:
+                    y_max = 5*(int(y/5)+1)
+            ydata.append(y)
+        ydatas.append(ydata)
+    # thin out a long history (y_max is still that of all the values)
+    if PLOT_MAX_POINTS and len(xdata) > PLOT_MAX_POINTS and PLOT_DOWNSAMPLE != 'none':
+        (xdata, ydatas) = downsample_plot(xdata, ydatas, PLOT_DOWNSAMPLE, PLOT_MAX_POINTS)
     # add legend to Y values
     # first change the base "Q Rate" to a better name
     if base_col == "Q Rate":
         plot_cols[0] = "Q / NQ"
-    ax.legend( plot_cols )
-    # format X-axis to show the dates correctly with ticks at each month
-    ax.xaxis.set_major_locator(mdates.MonthLocator())
-    fig.autofmt_xdate()
-    # set limits of y-axis
-    ax.set_ylim(0, y_max)
-    # Save plot as SVG to a string buffer in lieu of a file
-    buffer = io.StringIO()
-    fig.savefig(buffer, format='svg', dpi=1200, bbox_inches='tight')
-    svg = buffer.getvalue()
-    # clear the plot (to free up memory)
-    plt.close('all')
-    return svg
-
-def dump_data(file, runs, name):
-    print('DEBUG: Writing', file)
- 
-    # compile a list of columns across all runs (in original order)
-    cols = []
-    for run in runs:
-        for col in run.keys():
-            if col not in cols:
-                cols.append(col)
-   
-    # write all runs to the file
-    with open(file, 'w') as w:
-        write_html_header(w)
-        write_section_header(w, name)
-        write_table_header(w, name, "Data Dump", cols)
-        for run in runs:
-            write_table_row(w, cols, run)
-        write_table_footer(w)
-        write_section_footer(w)
-        write_html_footer(w)    
+    return (plot_cols, xdata, ydatas, y_max)
 
-# # 
-# # Main execution starts here
-# #    
+# Downsample the data of a plot: the dates and the values of each line (the base column,
+# then its averages), with the 'lttb', 'week' or 'month' mode of PLOT_DOWNSAMPLE
+def downsample_plot(xdata, ydatas, mode, max_points):
+    if mode == 'lttb':
+        indexes = lttb_indexes([x.toordinal() for x in xdata], ydatas, max_points).tolist()
+        return ([xdata[i] for i in indexes], [[ydata[i] for i in indexes] for ydata in ydatas])
+    # one point per week or month, at the last run in it: the mean of the base column, and
+    # the averages as they were after that run
+    if mode == 'week':
+        periods = [x.isocalendar()[:2] for x in xdata]
+    else:
+        periods = [(x.year, x.month) for x in xdata]
+    ends = [i for i in range(len(periods)) if i + 1 == len(periods) or periods[i + 1] != periods[i]]
+    starts = [0] + [end + 1 for end in ends[:-1]]
+    base = [sum(ydatas[0][start:end + 1]) / (end + 1 - start) for (start, end) in zip(starts, ends)]
+    return ([xdata[end] for end in ends], [base] + [[ydata[end] for end in ends] for ydata in ydatas[1:]])
+
+# Indexes of the points to keep of long lines by Largest Triangle Three Buckets (LTTB),
+# for all the lines at once as they share the x values. The first and the last point are
+# kept, and the points between are split into max_points - 2 buckets. From each bucket
+# the point is kept that makes the largest triangles (summed over the lines) with the
+# point kept from the bucket before it and the mean of the bucket after it.
+def lttb_indexes(xs, ys, max_points):
+    n = len(xs)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.array(xs, dtype=np.float64)
+    y = np.array(ys, dtype=np.float64)
+    # bucket b is the points edges[b] up to edges[b+1]; the last point is a bucket of its own
+    edges = np.append(np.linspace(1, n - 1, max_points - 1).astype(np.int64), n)
+    indexes = np.empty(max_points, dtype=np.int64)
+    indexes[0] = 0
+    indexes[-1] = n - 1
+    a = 0
+    for b in range(max_points - 2):
+        (start, end, next_end) = edges[b:b+3]
+        next_x = x[end:next_end].mean()
+        next_y = y[:, end:next_end].mean(axis=1)
+        # twice the area of the triangles (a, each point of the bucket, mean of the next)
+        areas = np.abs((x[a] - next_x) * (y[:, start:end] - y[:, a, None])
+                       - (x[a] - x[start:end]) * (next_y[:, None] - y[:, a, None])).sum(axis=0)
+        a = start + int(areas.argmax())
+        indexes[b + 1] = a
+    return indexes
+
+# Number of months between the x-axis ticks of a plot of these dates (in date order),
+# so a plot has at most about PLOT_MAX_TICKS ticks
+def tick_months(xdata):
+    if not xdata:
+        return 1
+    months = (xdata[-1].year - xdata[0].year) * 12 + xdata[-1].month - xdata[0].month + 1
+    return max(1, -(-months // PLOT_MAX_TICKS))
+
+# Range of the x-axis of a plot with no points
+EMPTY_PLOT_DATES = (DEFAULT_DATE, DEFAULT_DATE + datetime.timedelta(days=365))
+
+# Reusable matplotlib figure for the plots
+# Creating a figure is slow, so one figure with its three lines is created once
+# and only the data of the lines is replaced for each plot
+class PlotRenderer:
+    def __init__(self):
+        load_matplotlib()
+        # the plots are only saved: pyplot must not try to open a GUI window
+        matplotlib.use('Agg')
+        # keep the ids inside the SVG the same from one report to the next
+        plt.rcParams['svg.hashsalt'] = 'AgilitySummaryReporter'
+        self.fig, self.ax = plt.subplots()
+        # set size
+        self.fig.set_figheight(5)
+        self.fig.set_figwidth(18)
+        self.lines = [self.ax.plot([], [], 'o-')[0] for i in range(3)]
+        # format X-axis to show the dates correctly with ticks at each month
+        self.ax.xaxis_date()
+        self.ax.xaxis.set_major_locator(mdates.MonthLocator())
+        self.tick_months = 1
+        # fixed margins in lieu of bbox_inches='tight', which renders each plot twice
+        self.fig.subplots_adjust(left=0.04, right=0.99, top=0.96, bottom=0.2)
 
-file_metas = []
-# Read the PawPrintTrials CSV file into memory
-(runs, meta) = read_csv(ppt_csv_file, ppt_csv_cols, "PawPrint")
-map_ppt_columns(runs)
-file_metas.append(meta)
+    # Render one plot as an SVG string or, for 'png', as an <img> tag with the PNG inline
+    def render(self, plot_cols, xdata, ydatas, y_max, image_format):
+        # thin out the monthly ticks of a long history
+        if tick_months(xdata) != self.tick_months:
+            self.tick_months = tick_months(xdata)
+            self.ax.xaxis.set_major_locator(mdates.MonthLocator(interval=self.tick_months))
+        x = mdates.date2num(xdata)
+        for line, ydata in zip(self.lines, ydatas):
+            line.set_data(x, ydata)
+        self.ax.legend(self.lines, plot_cols)
+        # set the limits of the x-axis on every plot, so no plot depends on the one before
+        if xdata:
+            # from the data (set_xlim() turns autoscaling off, so turn it back on first)
+            self.ax.set_autoscalex_on(True)
+            self.ax.relim()
+            self.ax.autoscale_view()
+            self.ax.set_xlim(self.ax.get_xlim())
+        else:
+            # a plot with no points (no Q runs) shows a fixed year
+            self.ax.set_xlim(mdates.date2num(EMPTY_PLOT_DATES))
+        self.fig.autofmt_xdate()
+        # set limits of y-axis
+        self.ax.set_ylim(0, y_max)
+        if image_format == 'png':
+            buffer = io.BytesIO()
+            self.fig.savefig(buffer, format='png', dpi=PLOT_DPI)
+            png = base64.b64encode(buffer.getvalue()).decode('ascii')
+            return '<img src="data:image/png;base64,' + png + '">\n'
+        # Save plot as SVG to a string buffer in lieu of a file
+        buffer = io.StringIO()
+        self.fig.savefig(buffer, format='svg', metadata={'Date': None})
+        return buffer.getvalue()
 
-if CREATE_DEBUG_FILES: dump_data(debug_file_ppt, runs, "Paw Print Trials")
+# The one PlotRenderer, created on first use
+plot_renderer = None
 
-# Read the FeelTheRuch CSV file into memory
-(ftr_runs, meta) = read_csv(ftr_csv_file, ftr_csv_cols, "FeelTheRush")
-file_metas.append(meta)
-map_ftr_columns(ftr_runs)
+# Create a plot (x-y graph) of the base column and its computed stats columns
+# Uses the date as the x-axis, groups in months
+# plot is converted to SVG (or PNG, see PLOT_FORMAT) and returned as a large python string
+def create_plot_as_svg(table_runs, base_col):
+    return render_plot(get_plot_data(table_runs, base_col))
 
-if CREATE_DEBUG_FILES: dump_data(debug_file_ftr, ftr_runs, "Feel The Rush")
+# Render a plot from the data returned by get_plot_data()
+def render_plot(plot_data):
+    global plot_renderer
+    (plot_cols, xdata, ydatas, y_max) = plot_data
+    if PLOT_FORMAT == 'svg-lite':
+        return create_lite_svg(plot_cols, xdata, ydatas, y_max)
+    if plot_renderer is None:
+        plot_renderer = PlotRenderer()
+    return plot_renderer.render(plot_cols, xdata, ydatas, y_max, PLOT_FORMAT)
 
-# Merge FTR runs into the PPT runs
-runs.extend(ftr_runs)
-runs.sort(key=lambda r: r['SortDate'])
+# Set up each worker process that renders plots (or parses --input files) for --jobs
+# matplotlib is only imported once a worker renders its first plot (see PlotRenderer)
+def init_plot_worker(plot_format):
+    global PLOT_FORMAT
+    PLOT_FORMAT = plot_format
 
-# clean up data
-remove_absences(runs)
-group_level_and_class(runs)
-merge_faults(runs)
+# Create a pool of worker processes to render plots, or None for just one job
+def create_plot_executor(jobs):
+    if jobs <= 1:
+        return None
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_plot_worker, initargs=(PLOT_FORMAT,))
 
+# Render a list of get_plot_data() results, by the pool of worker processes if there is one
+# Yields the SVG strings in the same order as plot_jobs either way
+def render_plots(plot_jobs, executor, jobs):
+    if executor is None:
+        for plot_data in plot_jobs:
+            yield render_plot(plot_data)
+        return
+    log.info('Rendering %d plots with %d jobs', len(plot_jobs), jobs)
+    # send the plots in chunks to cut down on the inter-process overhead
+    chunksize = max(1, len(plot_jobs) // (jobs * 4))
+    yield from executor.map(render_plot, plot_jobs, chunksize=chunksize)
 
-# Get lists of unique dogs and catlog classes into groups
-dogs = group_dogs(runs)
+# Get all the plots of the report from a list of (cache key, plot data) pairs
+# Plots found in the cache are read from it; the rest are rendered and added to it
+# Yields the SVG strings in the same order as plot_jobs
+def create_plots(plot_jobs, cache, executor, jobs):
+    plot_data = [data for (key, data) in plot_jobs if data is not None]
+    rendered = render_plots(plot_data, executor, jobs)
+    for (key, data) in plot_jobs:
+        if data is None:
+            yield cache.get(key)
+        else:
+            svg = next(rendered)
+            cache.put(key, svg)
+            yield svg
 
-# Calculate and add statistics columns to the data 
-stat_cols = calc_stats(runs, dogs, groups)
+# Import matplotlib on first use, as it adds about a second to the start up
+# Reports with only cached or 'svg-lite' plots never import it
+def load_matplotlib():
+    global matplotlib, plt, mdates
+    if matplotlib is None:
+        import matplotlib
+        from matplotlib import pyplot as plt
+        import matplotlib.dates as mdates
 
-# Create the HTML output file
-print('Writing', report_file)
-with open(report_file, 'w') as w:
+# matplotlib and its modules, set by load_matplotlib()
+matplotlib = None
+plt = None
+mdates = None
+
+# Version of matplotlib (for the cache keys of plots) without importing it
+@functools.lru_cache(maxsize=None)
+def matplotlib_version():
+    return importlib.metadata.version('matplotlib')
+
+# The settings a plot is rendered with, for the cache keys of plots and pages
+# Only svg & png plots are rendered by matplotlib, svg-lite runs may not have it installed
+def plot_params():
+    version = matplotlib_version() if PLOT_FORMAT in ('svg', 'png') else None
+    return (PLOT_FORMAT, PLOT_DPI, version, PLOT_MAX_POINTS, PLOT_DOWNSAMPLE, PLOT_MAX_TICKS)
+
+# Name of the file of a plot in a plot directory (for --shard-dir)
+def plot_file_name(key):
+    return key + ('.png' if PLOT_FORMAT == 'png' else '.svg')
+
+# Render the plots that are not in the plot directory yet and save them in it
+# Yields a lazy loading <img> tag of each plot, in the same order as plot_jobs
+def create_plot_files(plot_jobs, plot_dir, executor, jobs):
+    rendered = render_plots([data for (key, data) in plot_jobs if data is not None], executor, jobs)
+    link_dir = os.path.basename(plot_dir)
+    for (key, data) in plot_jobs:
+        name = plot_file_name(key)
+        if data is not None:
+            plot = next(rendered)
+            if PLOT_FORMAT == 'png':
+                # render_plot() gives a PNG as an <img> tag with the data inline
+                content = base64.b64decode(plot.split(',', 1)[1].split('"', 1)[0])
+            else:
+                content = plot.encode('utf-8')
+            write_file_atomic(os.path.join(plot_dir, name), content)
+        yield '<img loading="lazy" src="' + link_dir + '/' + name + '" alt="">\n'
+
+# Write a file under a temporary name first and then rename it, so a partial file is never read
+def write_file_atomic(path, content):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+# Colors of the plot lines (the matplotlib defaults)
+plot_colors = ("#1f77b4", "#ff7f0e", "#2ca02c")
+
+# Create a plot as a compact hand-written SVG, without matplotlib
+# Each line is one polyline and its points are drawn as dots by a single path
+def create_lite_svg(plot_cols, xdata, ydatas, y_max):
+    # same size as the matplotlib plot: 18 x 5 inches at 72 points per inch
+    width, height = 1296, 360
+    left, right, top, bottom = 50, width - 10, 10, height - 70
+    # x-axis range in days, with a 5% margin on each side like matplotlib
+    days = [x.toordinal() for x in xdata]
+    if days:
+        (first, last) = (min(days), max(days))
+        margin = (last - first) * 0.05 if last > first else 1
+        x_min, x_max = first - margin, last + margin
+    else:
+        # a plot with no points (no Q runs) shows a fixed year, like PlotRenderer
+        x_min, x_max = [date.toordinal() for date in EMPTY_PLOT_DATES]
+    def px(day):
+        return left + (day - x_min) * (right - left) / (x_max - x_min)
+    def py(y):
+        return bottom - min(y, y_max) * (bottom - top) / y_max
+    svg = []
+    svg.append('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d" font-family="sans-serif" font-size="10">\n' % (width, height, width, height))
+    svg.append('<rect x="%d" y="%d" width="%d" height="%d" fill="none" stroke="#000"/>\n' % (left, top, right - left, bottom - top))
+    # y-axis ticks and labels at each 1/5 of the range
+    for i in range(6):
+        y = y_max * i / 5
+        svg.append('<text x="%d" y="%.1f" text-anchor="end">%g</text>\n' % (left - 4, py(y) + 3, y))
+    # x-axis ticks and labels at the first of each month (or every few months)
+    interval = tick_months(xdata)
+    day = datetime.date.fromordinal(int(x_min) + 1)
+    month = datetime.date(day.year, day.month, 1)
+    while month.toordinal() <= x_max:
+        if month.toordinal() >= x_min:
+            x = px(month.toordinal())
+            svg.append('<path d="M%.1f,%dv4" stroke="#000"/>' % (x, bottom))
+            svg.append('<text transform="translate(%.1f,%d) rotate(-30)" text-anchor="end">%s</text>\n' % (x, bottom + 12, month.strftime('%Y-%m')))
+        index = month.year * 12 + month.month - 1 + interval
+        month = datetime.date(index // 12, index % 12 + 1, 1)
+    # the data as lines and dots
+    for color, ydata in zip(plot_colors, ydatas):
+        points = ' '.join('%.1f,%.1f' % (px(d), py(y)) for d, y in zip(days, ydata))
+        dots = ''.join('M%.1f,%.1fh0' % (px(d), py(y)) for d, y in zip(days, ydata))
+        svg.append('<polyline points="%s" fill="none" stroke="%s" stroke-width="1.5"/>\n' % (points, color))
+        if dots:
+            svg.append('<path d="%s" stroke="%s" stroke-width="6" stroke-linecap="round"/>\n' % (dots, color))
+    # legend in the top right corner
+    for i, (color, label) in enumerate(zip(plot_colors, plot_cols)):
+        y = top + 14 + 14 * i
+        svg.append('<path d="M%d,%dh20" stroke="%s" stroke-width="1.5"/><text x="%d" y="%d">%s</text>\n' % (right - 130, y - 3, color, right - 104, y, label))
+    svg.append('</svg>\n')
+    return ''.join(svg)
+
+# Extension of the debug files of each dump format
+dump_extensions = {'csv': '.csv', 'jsonl': '.jsonl', 'html': '.html'}
+
+# Number of runs formatted at a time by the debug file writers
+DUMP_CHUNK_SIZE = 10000
+
+# Write a debug file with the runs in one giant table
+# The columns are those of the runs (in original order) unless given
+# The extension of the dump format (and '.gz' if compressed) is added to the file name
+def dump_data(file, runs, name, cols=None, dump_format=DUMP_FORMAT, compress=DUMP_GZIP):
+    file += dump_extensions[dump_format] + ('.gz' if compress else '')
+    log.info('DEBUG: Writing %s', file)
+    if cols is None:
+        cols = dump_columns(runs)
+    # gzip level 1: these are big diagnostic files, fast matters more than small
+    if compress:
+        w = gzip.open(file, 'wt', compresslevel=1, encoding='utf-8', newline='')
+    else:
+        w = open(file, 'w', buffering=WRITE_BUFFER_SIZE, encoding='utf-8', newline='')
+    with w:
+        if dump_format == 'csv':
+            write_dump_csv(w, runs, cols)
+        elif dump_format == 'jsonl':
+            write_dump_jsonl(w, runs, cols)
+        else:
+            write_dump_html(w, runs, name, cols)
+
+# The columns across all runs (in original order)
+def dump_columns(runs):
+    # a dict is an insertion ordered set
+    return list(dict.fromkeys(itertools.chain.from_iterable(run.keys() for run in runs)))
+
+# The text of the runs as rows (tuples in the order of cols), in chunks of DUMP_CHUNK_SIZE
+# The text is formatted a column at a time, which is faster than calling get() per cell
+def dump_rows(runs, cols):
+    for start in range(0, len(runs), DUMP_CHUNK_SIZE):
+        chunk = runs[start:start + DUMP_CHUNK_SIZE]
+        yield zip(*[dump_column_text(chunk, col) for col in cols])
+
+# The text of one column of the runs, as get() formats it
+def dump_column_text(runs, col):
+    attr = run_attrs.get(col)
+    if attr is not None:
+        return list(map(column_formats.get(col, str), map(operator.attrgetter(attr), runs)))
+    return [run.get(col) for run in runs]
+
+# Write the runs as CSV, a header line and a line per run
+def write_dump_csv(w, runs, cols):
+    writer = csv.writer(w, lineterminator='\n')
+    writer.writerow(cols)
+    for rows in dump_rows(runs, cols):
+        writer.writerows(rows)
+
+# Write the runs as JSON Lines, an object of column text per run
+def write_dump_jsonl(w, runs, cols):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for rows in dump_rows(runs, cols):
+        w.write(''.join([encode(dict(zip(cols, row))) + '\n' for row in rows]))
+
+# Write the runs as an HTML page with one table
+def write_dump_html(w, runs, name, cols):
     write_html_header(w)
-    write_file_table(file_metas)
-    # each dog gets its own section
+    write_section_header(w, name)
+    write_table_header(w, name, "Data Dump", cols)
+    for start in range(0, len(runs), DUMP_CHUNK_SIZE):
+        write_table_rows(w, cols, runs[start:start + DUMP_CHUNK_SIZE])
+    write_table_footer(w)
+    write_section_footer(w)
+    write_html_footer(w)
+
+# Writes the debug files in a background thread, one after the other, while the report
+# is made. The runs of a dump are copied to a new list when it is submitted, but the runs
+# themselves are not: columns that may still change (the Group and the stats) must be left
+# out of the dumped columns, or the dump submitted after the runs are complete.
+# The time of the dumps overlaps the stages of the report, so it is given to the profiler
+# as a background time by wait(). With --profile-memory the dumps are written right away
+# instead, as a stage of their own: tracemalloc counts the memory of all the threads.
+class DumpWriter:
+    def __init__(self, dump_format=DUMP_FORMAT, compress=DUMP_GZIP):
+        self.dump_format = dump_format
+        self.compress = compress
+        if profiler.trace_memory:
+            self.executor = None
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='dump')
+        self.futures = []
+        # seconds taken by each dump on the dump thread
+        self.seconds = []
+
+    # Queue a debug file to be written by dump_data()
+    def submit(self, file, runs, name, cols=None):
+        if self.executor is None:
+            with profiler.stage('dump_data'):
+                dump_data(file, runs, name, cols, self.dump_format, self.compress)
+            return
+        self.futures.append(self.executor.submit(self.write, file, list(runs), name, cols))
+
+    # Write a debug file on the dump thread, timing it
+    def write(self, file, runs, name, cols):
+        start = time.perf_counter()
+        dump_data(file, runs, name, cols, self.dump_format, self.compress)
+        self.seconds.append(time.perf_counter() - start)
+
+    # Wait for all the debug files to be written (raising the error of any that failed)
+    def wait(self):
+        if self.executor is None:
+            return
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown()
+            profiler.background('dump_data', sum(self.seconds), len(self.seconds))
+
+# Write the leaderboard as an HTML page, a CSV file and a JSON file
+# The extension of each format is added to the file name. Each file is written whole
+# and then replaces the old one (see write_file_atomic()), as --watch rewrites them
+def save_leaderboard(file, leaderboard):
+    with profiler.stage('leaderboard'):
+        log.info('Writing %s.html, .csv & .json', file)
+        for (extension, write) in (('.html', write_leaderboard_html), ('.csv', write_leaderboard_csv), ('.json', write_leaderboard_json)):
+            buffer = io.StringIO(newline='')
+            write(buffer, leaderboard)
+            write_file_atomic(file + extension, buffer.getvalue().encode('utf-8'))
+
+# Text of a leaderboard value, formatted like the stats columns of the report
+def leaderboard_text(value):
+    return '' if value is None else str(round(value, 2)) if isinstance(value, float) else str(value)
+
+# Write the leaderboard as an HTML page with a table per group
+def write_leaderboard_html(w, leaderboard):
+    write_html_header(w)
+    now = datetime.datetime.now().strftime(FORMAT_DATE_TIME)
+    w.write('<p><b>Report Date:</b> ' + now + '</p>\n')
+    write_section_header(w, "Leaderboard")
+    year = leaderboard.nac_year()
+    if year:
+        (nac_start_date, nac_end_date) = nac_season(year)
+        w.write('<p><b>NAC MACH Pts:</b> ' + str(year) + ' NAC season, ' + format_date(nac_start_date)
+                + ' to ' + format_date(nac_end_date) + '</p>\n')
+    for group in leaderboard.groups():
+        write_table_header(w, "Leaderboard", group, leaderboard_cols)
+        rows = []
+        for row in leaderboard.rows(group):
+            text = {c: leaderboard_text(row.get(c)) for c in leaderboard_cols}
+            # Required for Table CSS (unranked dogs are greyed out like NQ runs)
+            text["Result"] = "Q" if "Rank" in row else "NQ"
+            rows.append(text)
+        write_table_rows(w, leaderboard_cols, rows)
+        write_table_footer(w)
+    write_section_footer(w)
+    write_html_footer(w)
+
+# Write the leaderboard as CSV, a line per dog of each group
+# The NAC MACH Pts are those of the NAC Year column; the MACH points of every NAC year
+# follow in a column per year
+def write_leaderboard_csv(w, leaderboard):
+    writer = csv.writer(w, lineterminator='\n')
+    years = leaderboard.nac_years()
+    writer.writerow(["Group"] + leaderboard_cols + ["NAC Year"] + ["NAC %d MACH Pts" % y for y in years])
+    year = leaderboard_text(leaderboard.nac_year())
+    for group in leaderboard.groups():
+        for row in leaderboard.rows(group):
+            points = row["NAC MACH Pts by Year"]
+            writer.writerow([group] + [leaderboard_text(row.get(c)) for c in leaderboard_cols] + [year]
+                            + [str(points.get(y, 0)) for y in years])
+
+# Write the leaderboard as JSON: the NAC year and the ranked rows of each group
+# The values are numbers (null when there is none), not text, and each row has the
+# MACH points of every NAC year by year
+def write_leaderboard_json(w, leaderboard):
+    board = {"NAC Year": leaderboard.nac_year(), "Groups": dict()}
+    cols = leaderboard_cols + ["NAC MACH Pts by Year"]
+    for group in leaderboard.groups():
+        board["Groups"][group] = [{c: row.get(c) for c in cols} for row in leaderboard.rows(group)]
+    json.dump(board, w, indent=2, ensure_ascii=False)
+
+# Write the section of each dog to the report: a table and plots per group and the NAC points
+# The partitions (and NumPy stats) must include all the runs of these dogs
+# With a plot directory the plots are saved as files in it, shown by <img> tags, and the
+# names of the plot files are returned
+def write_dog_sections(w, dogs, partitions, numpy_stats, cache, executor, jobs, plot_dir=None, with_plots=True):
+    # Collect the data for every plot first so they can be rendered in parallel
+    # Plots already in the cache (same runs, same rendering) have no data to render
+    with profiler.stage('plot_data'):
+        (plot_jobs, digests) = collect_plot_jobs(dogs, partitions, numpy_stats, cache, plot_dir, with_plots)
+    # the plots in the same order as plot_jobs (none for a report of tables only)
+    if not with_plots:
+        plots = None
+    elif plot_dir:
+        plots = create_plot_files(plot_jobs, plot_dir, executor, jobs)
+    else:
+        plots = create_plots(plot_jobs, cache, executor, jobs)
+    with profiler.stage('nac_points'):
+        nac_index = NacIndex(partitions, dogs)
+
+    # each dog gets its own section, collected in a buffer and written with one write
+    for dog in dogs:
+        buffer = io.StringIO()
+        write_dog_section(buffer, dog, partitions, digests, plots, cache, nac_index)
+        with profiler.stage('write'):
+            w.write(buffer.getvalue())
+    if plot_dir:
+        return [plot_file_name(key) for (key, data) in plot_jobs]
+
+# Collect the plots of the dogs as (cache key, plot data) pairs, with data None for
+# plots already in the cache (or with a plot directory, already saved in it)
+# Returns the plots (none without with_plots) and the digest of each (dog, group)
+def collect_plot_jobs(dogs, partitions, numpy_stats, cache, plot_dir=None, with_plots=True):
+    plot_jobs = []
+    digests = dict()
+    params = plot_params() if with_plots else None
     for dog in dogs:
-        write_section_header(w, dog)
-        # create a table for each group (aka agility class)
         for group in groups:
-            table_runs = [run for run in runs if run.get('Dog')==dog and run.get('Group')==group]
-            # skip empty tables and odd-ball classes
+            table_runs = partitions.get((dog, group), [])
+            # the NumPy stats are only written into the runs when they are rendered
+            if (dog, group) in numpy_stats:
+                write_stats(table_runs, numpy_stats[(dog, group)])
             if table_runs and (not group == "Other"):
-                # Create the table
-                write_table_header(w, dog, group, table_cols[group])
-                for run in table_runs:
-                    write_table_row(w, table_cols[group], run)
-                write_table_footer(w)
-                # Create a plot for each stat_col in this table
-                for col in stat_cols:
-                    # only show plot if applicable to this group/table
-                    if (col in table_cols[group]) or (col == "Q Rate"):
-                        print('     Plot:', dog, group, col)
-                        svg = create_plot_as_svg(table_runs, col)
-                        write_svg_plot(w, svg, col)
-                        svg = None # help garbage collect
-        # Table of MACH pts for NAC by year
-        # TODO: Fixed hard-coded years
+                digests[(dog, group)] = partition_digest(table_runs)
+                if not with_plots:
+                    continue
+                # a plot of each stats column of this group/table
+                for col in group_stat_cols[group]:
+                    key = cache.key('plot', digests[(dog, group)], col, params)
+                    if plot_dir:
+                        found = os.path.exists(os.path.join(plot_dir, plot_file_name(key)))
+                    else:
+                        found = cache.contains(key)
+                    if found:
+                        plot_jobs.append((key, None))
+                    else:
+                        log.debug('     Plot: %s %s %s', dog, group, col)
+                        plot_jobs.append((key, get_plot_data(table_runs, col)))
+    return (plot_jobs, digests)
+
+# Write the section of one dog: the table & plots of each group and the NAC points table
+# The plots are taken in order from the plots iterator of write_dog_sections() (None for no plots)
+def write_dog_section(w, dog, partitions, digests, plots, cache, nac_index):
+    write_section_header(w, dog)
+    # create a table for each group (aka agility class)
+    for group in groups:
+        table_runs = partitions.get((dog, group), [])
+        # skip empty tables and odd-ball classes
+        if table_runs and (not group == "Other"):
+            with profiler.table(dog, group, len(table_runs)):
+                write_group_section(w, dog, group, table_runs, digests, plots, cache)
+    # Table of MACH pts for NAC by year, for every season of the dog
+    with profiler.stage('nac_points'):
         nac_cols = ("NAC Year", "Start Date", "End Date", "MACH Pts")
         write_table_header(w, dog, "NAC Points", nac_cols)
-        for year in (2022, 2023, 2024, 2025):
-            run = calc_nac_points(runs, dog, year)
-            write_table_row(w, nac_cols, run)
+        nac_runs = [nac_points_row(nac_index, dog, year) for year in nac_index.years(dog)]
+        write_table_rows(w, nac_cols, nac_runs)
         write_table_footer(w)
-        write_section_footer(w)
-    write_html_footer(w)
+    write_section_footer(w)
+
+# Write the table and the plots of one (dog, group)
+def write_group_section(w, dog, group, table_runs, digests, plots, cache):
+    # Create the table (or reuse it from the cache)
+    with profiler.stage('tables'):
+        key = cache.key('table', digests[(dog, group)], dog, group, table_cols[group])
+        if cache.contains(key):
+            table = cache.get(key)
+        else:
+            table = render_table(dog, group, table_cols[group], table_runs)
+            cache.put(key, table)
+        w.write(table)
+    # Create a plot for each stats column of this group/table
+    if plots is None:
+        return
+    with profiler.stage('plots'):
+        for col in group_stat_cols[group]:
+            svg = next(plots)
+            write_svg_plot(w, svg, dog, group, col)
+            svg = None # help garbage collect
+
+# Persistent cache of rendered HTML/SVG fragments, one file per key in a directory
+# Keys are hashes of everything that goes into a fragment, so a changed input gives a
+# new key and stale entries are simply never read again. Entries are touched when used
+# and the least recently used are removed once the directory is over max_bytes.
+# With no directory the cache is disabled: nothing is found and nothing is saved.
+class FragmentCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # Make a cache key from the parts (any values with a stable repr)
+    def key(self, *parts):
+        return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.html')
+
+    # Check for a fragment and count the hit or miss
+    def contains(self, key):
+        found = bool(self.directory) and os.path.exists(self.path(key))
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    # Read a fragment that contains() found, marking it as recently used
+    def get(self, key):
+        path = self.path(key)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        os.utime(path)
+        return text
+
+    # Save a fragment; written to a temp file first so a partial file is never read
+    def put(self, key, text):
+        if self.directory:
+            path = self.path(key)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+
+    # Remove the least recently used fragments until the cache is under max_bytes
+    def evict(self):
+        if not self.directory:
+            return
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.html'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        removed = 0
+        for (mtime, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        if removed:
+            log.info('Cache: removed %d old entries', removed)
+
+    def print_stats(self):
+        if self.directory:
+            log.info('Cache: %d hits, %d misses', self.hits, self.misses)
+
+# Records the wall time, number of calls and memory allocated by each stage of the report,
+# and the time of each (dog, group) table. Stages are timed by wrapping them in
+# 'with profiler.stage(name):'. Until start() is called nothing is recorded, so the stages
+# cost next to nothing without --profile. With trace_memory, memory is traced with
+# tracemalloc and the bytes of a stage are those it allocated and still holds at its end.
+# With cprofile, the whole run is also profiled function by function with cProfile.
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.cprofile = None
+        self.stages = dict()
+        self.tables = dict()
+        # work done in other threads, at the same time as the stages
+        self.background_stages = dict()
+        self.start_time = None
+
+    # Start recording
+    def start(self, trace_memory=False, cprofile=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.start_time = time.perf_counter()
+        if trace_memory:
+            tracemalloc.start()
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    # Time a stage of the report; a stage that is run many times adds up
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start_bytes = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'allocated_bytes': 0})
+            stage['seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+            if self.trace_memory:
+                stage['allocated_bytes'] += tracemalloc.get_traced_memory()[0] - start_bytes
+
+    # Record the time & calls of work done in another thread (given by the main thread)
+    # It is kept apart from the stages, as it overlaps them
+    def background(self, name, seconds, calls):
+        if self.enabled:
+            self.background_stages[name] = {'seconds': round(seconds, 4), 'calls': calls}
 
-# optionally create the debug file with all data in one giant table
-if CREATE_DEBUG_FILES: dump_data(debug_file, runs, "Dump of All Data")
+    # Time writing the table (and plots) of one (dog, group) with its number of runs
+    @contextlib.contextmanager
+    def table(self, dog, group, runs):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tables[(dog, group)] = (runs, time.perf_counter() - start)
+
+    # Stop recording and return a summary of everything recorded (that can be saved as JSON)
+    # The cProfile stats are saved to stats_file
+    def stop(self, stats_file=None, top=30):
+        summary = {'total_seconds': round(time.perf_counter() - self.start_time, 4)}
+        summary['stages'] = {name: dict(stage, seconds=round(stage['seconds'], 4))
+                             for (name, stage) in self.stages.items()}
+        if self.background_stages:
+            summary['background'] = dict(self.background_stages)
+        tables = sorted(self.tables.items(), key=lambda t: t[1][1], reverse=True)
+        summary['tables'] = [{'dog': dog, 'group': group, 'runs': runs, 'seconds': round(seconds, 4)}
+                             for ((dog, group), (runs, seconds)) in tables]
+        if self.trace_memory:
+            summary['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if self.cprofile:
+            self.cprofile.disable()
+            stats = pstats.Stats(self.cprofile)
+            if stats_file:
+                stats.dump_stats(stats_file)
+            # the top functions by cumulative time
+            functions = sorted(stats.stats.items(), key=lambda f: f[1][3], reverse=True)[:top]
+            summary['functions'] = [{'function': '%s:%d(%s)' % func, 'calls': calls,
+                                     'seconds': round(tottime, 4), 'cumulative_seconds': round(cumtime, 4)}
+                                    for (func, (prim_calls, calls, tottime, cumtime, callers)) in functions]
+            self.cprofile = None
+        self.enabled = False
+        return summary
+
+# The one Profiler of the report, started by --profile
+profiler = Profiler()
+
+# Log a profile summary as a table of the stages and the slowest tables
+def log_profile(summary, top_tables=10):
+    log.info('%-16s %10s %8s %14s', 'Stage', 'Seconds', 'Calls', 'Allocated KB')
+    for (name, stage) in summary['stages'].items():
+        log.info('%-16s %10.3f %8d %14.1f', name, stage['seconds'], stage['calls'], stage['allocated_bytes'] / 1024)
+    log.info('%-16s %10.3f', 'total', summary['total_seconds'])
+    for (name, stage) in summary.get('background', dict()).items():
+        log.info('%-16s %10.3f %8d   (in the background)', name, stage['seconds'], stage['calls'])
+    for table in summary['tables'][:top_tables]:
+        log.info('  Table: %s %s: %d runs, %.3f s', table['dog'], table['group'], table['runs'], table['seconds'])
+
+# Run fields saved as codes into the string table of a RunStore
+store_text_attrs = ('source', 'club', 'location', 'dog', 'handler', 'judge', 'level', 'agility_class',
+                    'group', 'trial_num', 'yards', 'sct', 'time', 'result', 'place', 'top25', 'run_id',
+                    'class_text')
+# Run fields saved as floats (NaN for None) in a RunStore
+store_number_attrs = ('yps', 'score', 'mach_pts', 't2b_pts')
+# NumPy type of the column of each Run field in a RunStore
+store_types = dict([('date', '<i4')] + [(a, '<i4') for a in store_text_attrs] +
+                   [(a, '<f8') for a in store_number_attrs] + [('faults', '<i2')])
+
+# The cleaned runs of a report saved in a directory as one NumPy array (.npy) per Run field
+# The runs are in date order. Dates are saved as day numbers, the fault counts as one row of
+# counts per run and each text field as an index into the table of distinct strings in
+# strings.json. meta.json has the input files the runs were read from (with their sizes &
+# modification times) and their file meta data, and checkpoints.pickle the StatsCheckpoints
+# of the runs. The arrays are opened with mmap_mode, so
+# opening a store takes milliseconds and reports of different dogs (in other processes
+# too) share one copy in the page cache; only the Runs that are asked for are created.
+class RunStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = None
+        self.columns = None
+        self.strings = None
+        self.codes = None
+        self.stats_checkpoints = None
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        if meta.get('Version') == RUN_STORE_VERSION:
+            self.meta = meta
+
+    # Signature of the input files: their paths, sizes & modification times
+    @staticmethod
+    def inputs_signature(files, bulk):
+        signature = [bulk]
+        for file in files:
+            stat = os.stat(file)
+            signature.append([os.path.abspath(file), stat.st_size, stat.st_mtime_ns])
+        return signature
+
+    # True if the store has the runs of these input files (bulk for --input)
+    def matches(self, files, bulk):
+        try:
+            return self.meta is not None and self.meta['Inputs'] == self.inputs_signature(files, bulk)
+        except OSError:
+            return False
+
+    # The meta data of the input files, for the report's file table
+    def file_metas(self):
+        return self.meta['File Metas']
+
+    # Write a file of the store under a temporary name first, so a half written file is never read
+    def write_file(self, name, write):
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            write(f)
+        os.replace(path + '.tmp', path)
+
+    # Save the runs of the input files (from load_runs() or load_runs_from_files())
+    def save(self, runs, file_metas, files, bulk):
+        os.makedirs(self.directory, exist_ok=True)
+        # meta.json goes first and last, so a store that is being saved is never used
+        if os.path.exists(os.path.join(self.directory, 'meta.json')):
+            os.remove(os.path.join(self.directory, 'meta.json'))
+        strings = dict()
+        columns = {'date': [run.date.toordinal() for run in runs]}
+        for attr in store_text_attrs:
+            columns[attr] = [strings.setdefault(getattr(run, attr), len(strings)) for run in runs]
+        for attr in store_number_attrs:
+            columns[attr] = [np.nan if getattr(run, attr) is None else getattr(run, attr) for run in runs]
+        columns['faults'] = np.array([run.faults for run in runs], dtype=store_types['faults']).reshape(len(runs), len(fault_names))
+        for (attr, column) in columns.items():
+            self.write_file(attr + '.npy', lambda f: np.save(f, np.asarray(column, dtype=store_types[attr])))
+        self.write_file('strings.json', lambda f: f.write(json.dumps(list(strings)).encode('utf-8')))
+        checkpoints = StatsCheckpoints.build(partition_runs(runs))
+        self.write_file('checkpoints.pickle', lambda f: pickle.dump(checkpoints.checkpoints, f, protocol=pickle.HIGHEST_PROTOCOL))
+        meta = {'Version': RUN_STORE_VERSION, 'Inputs': self.inputs_signature(files, bulk),
+                'File Metas': file_metas, 'Runs': len(runs)}
+        self.write_file('meta.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        self.meta = meta
+        self.columns = None
+        self.stats_checkpoints = checkpoints
+        log.info('Saved %d runs to %s', len(runs), self.directory)
+
+    # Open the columns (memory mapped) and the string table
+    def open(self):
+        if self.columns is None:
+            self.columns = {attr: np.load(os.path.join(self.directory, attr + '.npy'), mmap_mode='r')
+                            for attr in store_types}
+            with open(os.path.join(self.directory, 'strings.json'), encoding='utf-8') as f:
+                self.strings = json.load(f)
+            self.codes = {text: i for (i, text) in enumerate(self.strings)}
+        return self.columns
+
+    # The StatsCheckpoints of the runs
+    def checkpoints(self):
+        if self.stats_checkpoints is None:
+            with open(os.path.join(self.directory, 'checkpoints.pickle'), 'rb') as f:
+                self.stats_checkpoints = StatsCheckpoints(pickle.load(f))
+        return self.stats_checkpoints
+
+    # Reverse sorted list of the dog names, the same as group_dogs()
+    def dogs(self):
+        columns = self.open()
+        return sorted((self.strings[i] for i in np.unique(columns['dog']) if self.strings[i]), reverse=True)
+
+    # Load the runs (in date order) as Runs, all of them or only those of one dog
+    # With a RunSelection only the selected runs are loaded, and with a start date only
+    # the runs since then (the selection's first date is left to select_since())
+    # The selected rows are found on the memory mapped columns, so only their pages are read
+    def load(self, dog=None, selection=None, start=None):
+        columns = self.open()
+        conditions = []
+        if dog is not None:
+            conditions.append(self.text_condition('dog', [dog]))
+        if selection:
+            for (attr, texts) in (('dog', selection.dogs), ('group', selection.groups), ('source', selection.sources)):
+                if texts is not None:
+                    conditions.append(self.text_condition(attr, texts))
+            if selection.until:
+                conditions.append(columns['date'] <= selection.until.toordinal())
+        if start:
+            conditions.append(columns['date'] >= start.toordinal())
+        if conditions:
+            rows = np.flatnonzero(np.logical_and.reduce(conditions))
+        else:
+            rows = slice(None)
+        strings = self.strings.__getitem__
+        values = [map(datetime.date.fromordinal, columns['date'][rows].tolist())]
+        values += [map(strings, columns[a][rows].tolist()) for a in store_text_attrs]
+        values += [[None if v != v else v for v in columns[a][rows].tolist()] for a in store_number_attrs]
+        values.append(map(tuple, columns['faults'][rows].tolist()))
+        values.append(itertools.repeat(None))
+        attrs = ('date',) + store_text_attrs + store_number_attrs + ('faults', 'stats')
+        # create the Runs without __init__() and set one field of all the runs at a time
+        # with the slot's setter, which is much quicker than setting each run field by field
+        # The garbage collector is paused meanwhile, as Runs have no reference cycles
+        # and it would otherwise scan the growing list of runs over and over
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            runs = [Run.__new__(Run) for i in range(len(columns['date'][rows]))]
+            for (attr, column) in zip(attrs, values):
+                collections.deque(map(getattr(Run, attr).__set__, runs, column), maxlen=0)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        log.info('Loaded %d runs from %s', len(runs), self.directory)
+        return runs
+
+    # Which runs have one of the texts in a text column, as an array of bools
+    def text_condition(self, attr, texts):
+        return np.isin(self.columns[attr], [self.codes[text] for text in texts if text in self.codes])
+
+# Checkpoints of the running averages of each (dog, group) at the start of every NAC season,
+# saved in a RunStore. A report of the runs since a date then only loads the runs from the
+# start of its season, and their averages continue from the checkpoint of that season
+# (see compute_stats()) instead of replaying the whole history of the dog.
+# Each partition has the season start dates (as day numbers) from the season after its
+# first run to the season after its last run, and the RunningAverage state() of each stat
+# column before that date, so any season start within them has a checkpoint.
+class StatsCheckpoints:
+    def __init__(self, checkpoints):
+        # (dog, group): (season start day numbers, {col: state} before each start)
+        self.checkpoints = checkpoints
+
+    # Checkpoints of the partitions (the cleaned runs of a whole report)
+    @classmethod
+    def build(cls, partitions):
+        checkpoints = dict()
+        for ((dog, group), table_runs) in partitions.items():
+            histories = {col: RunningAverage(stat_windows[col]) for col in group_stat_cols[group]}
+            starts = []
+            states = []
+            year = None
+            for run in table_runs:
+                run_year = nac_year(run.date)
+                if year is not None and run_year > year:
+                    state = {col: history.state() for (col, history) in histories.items()}
+                    for y in range(year + 1, run_year + 1):
+                        starts.append(nac_season(y)[0].toordinal())
+                        states.append(state)
+                year = run_year
+                for (col, history) in histories.items():
+                    value = stat_value(run, col)
+                    if value is not None:
+                        history.add(value)
+            if year is not None:
+                starts.append(nac_season(year + 1)[0].toordinal())
+                states.append({col: history.state() for (col, history) in histories.items()})
+            checkpoints[(dog, group)] = (starts, states)
+        return cls(checkpoints)
+
+    # The RunningAverages of each partition before a date (the start of a season), for
+    # compute_stats(); partitions with no runs before the date are left out
+    def histories(self, date):
+        histories = dict()
+        for (key, (starts, states)) in self.checkpoints.items():
+            i = bisect.bisect_right(starts, date.toordinal())
+            if i:
+                histories[key] = {col: RunningAverage.from_state(state) for (col, state) in states[i-1].items()}
+        return histories
+
+# Hash of all the data of the runs in a (dog, group) partition, for cache keys
+def partition_digest(table_runs):
+    h = hashlib.sha256()
+    for run in table_runs:
+        h.update(repr(run.fields()).encode('utf-8'))
+    return h.hexdigest()
+
+# Name of the page of a dog in a sharded report: the name made safe for a file name,
+# with a hash of the full name so different names never share a page
+def shard_file_name(dog):
+    safe = re.sub(r'[^A-Za-z0-9]+', '-', dog).strip('-') or 'dog'
+    return safe + '-' + hashlib.sha256(dog.encode('utf-8')).hexdigest()[:8] + '.html'
+
+# Writes a report as pages in a directory (--shard-dir) instead of one big file:
+# index.html with the source file table and a list of the dogs, and a page per dog with
+# its tables. The plots are separate files in SHARD_PLOT_DIR shown by lazy loading <img>
+# tags, so a browser only loads the plots that are scrolled to. A dog's page is only
+# written when its runs (or the rendering) changed since the last report: manifest.json
+# has the key of each page and the plots it shows. Pages and plots that are no longer
+# used are removed by finish().
+class ShardWriter:
+    def __init__(self, directory, leaderboard=False, keep_others=False):
+        self.directory = directory
+        # link the index to the leaderboard page (saved in the directory by main())
+        self.leaderboard = leaderboard
+        # keep the pages of the dogs not written this time (for a report of a RunSelection)
+        self.keep_others = keep_others
+        self.plot_dir = os.path.join(directory, SHARD_PLOT_DIR)
+        os.makedirs(self.plot_dir, exist_ok=True)
+        try:
+            with open(os.path.join(directory, 'manifest.json')) as f:
+                self.old_manifest = json.load(f)
+        except (OSError, ValueError):
+            self.old_manifest = dict()
+        self.manifest = dict()
+        # page name and number of runs of each dog, for the index
+        self.dog_pages = dict()
+        self.written = 0
+
+    # Write the page of a dog, unless it is the same as the one written last time
+    # The partitions (and NumPy stats) must include all the runs of the dog
+    def write_dog(self, dog, partitions, numpy_stats, cache, executor, jobs, with_plots=True):
+        digests = []
+        run_count = 0
+        for group in groups:
+            table_runs = partitions.get((dog, group), [])
+            # the NumPy stats are only written into the runs when they are rendered
+            if (dog, group) in numpy_stats:
+                write_stats(table_runs, numpy_stats[(dog, group)])
+            if table_runs:
+                digests.append((group, partition_digest(table_runs)))
+                run_count += len(table_runs)
+        name = shard_file_name(dog)
+        self.dog_pages[dog] = (name, run_count)
+        key = cache.key('shard', dog, digests, table_cols, *(plot_params() if with_plots else ('no plots',)))
+        old = self.old_manifest.get(name)
+        if old and old['Key'] == key and os.path.exists(os.path.join(self.directory, name)):
+            self.manifest[name] = dict(old, Runs=run_count)
+            return
+        log.debug('  Page: %s', name)
+        buffer = io.StringIO()
+        write_html_header(buffer)
+        buffer.write('<p><a href="index.html">All dogs</a></p>\n')
+        plots = write_dog_sections(buffer, [dog], partitions, dict(), cache, executor, jobs, self.plot_dir, with_plots)
+        write_html_footer(buffer)
+        write_file_atomic(os.path.join(self.directory, name), buffer.getvalue().encode('utf-8'))
+        self.manifest[name] = {'Dog': dog, 'Key': key, 'Plots': plots, 'Runs': run_count}
+        self.written += 1
+
+    # Write the index page and the manifest, and remove the pages & plots no longer used
+    # With keep_others the pages of the other dogs from last time are kept and listed
+    def finish(self, file_metas):
+        if self.keep_others:
+            for (name, old) in self.old_manifest.items():
+                if name not in self.manifest and os.path.exists(os.path.join(self.directory, name)):
+                    self.manifest[name] = old
+                    self.dog_pages[old['Dog']] = (name, old.get('Runs'))
+            # in the order of group_dogs()
+            self.dog_pages = dict(sorted(self.dog_pages.items(), reverse=True))
+        buffer = io.StringIO()
+        write_html_header(buffer)
+        write_file_table(buffer, file_metas)
+        if self.leaderboard:
+            buffer.write('<p><a href="' + leaderboard_file + '.html">Leaderboard</a></p>\n')
+        buffer.write('<h2>Dogs</h2>\n<ul>\n')
+        for (dog, (name, run_count)) in self.dog_pages.items():
+            # the pages of a manifest from before the run counts were saved have none
+            runs = ' (' + str(run_count) + ' runs)' if run_count is not None else ''
+            buffer.write('  <li><a href="' + name + '">' + escape_html(dog) + '</a>' + runs + '</li>\n')
+        buffer.write('</ul>\n')
+        write_html_footer(buffer)
+        write_file_atomic(os.path.join(self.directory, 'index.html'), buffer.getvalue().encode('utf-8'))
+        write_file_atomic(os.path.join(self.directory, 'manifest.json'), json.dumps(self.manifest).encode('utf-8'))
+
+        for name in self.old_manifest:
+            if name not in self.manifest and os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
+        used = set(itertools.chain.from_iterable(page['Plots'] for page in self.manifest.values()))
+        for name in os.listdir(self.plot_dir):
+            if name not in used:
+                os.remove(os.path.join(self.plot_dir, name))
+        log.info('Wrote %d of %d dog pages to %s', self.written, len(self.manifest), self.directory)
+
+# Load the runs of a PawPrintTrials and a FeelTheRushTrials CSV file
+# The runs are merged, sorted by date, cleaned up and grouped, ready for render_report()
+# Returns the runs and the meta data of the two files (for the report's file table)
+# With a DumpWriter the runs of each file are dumped as read (without the Group)
+# With a RunSelection only the selected runs are read (see read_csv())
+def load_runs(ppt_file=ppt_csv_file, ftr_file=ftr_csv_file, ingest_dir=INGEST_DIR, dumps=None, selection=None):
+    file_metas = []
+    # Read the PawPrintTrials CSV file into memory
+    with profiler.stage('read_csv'):
+        (runs, meta) = read_csv(ppt_file, ppt_csv_cols, "PawPrint", ingest_dir, selection)
+    file_metas.append(meta)
+
+    if dumps: dumps.submit(debug_file_ppt, runs, "Paw Print Trials", read_cols)
+
+    # Read the FeelTheRuch CSV file into memory
+    with profiler.stage('read_csv'):
+        (ftr_runs, meta) = read_csv(ftr_file, ftr_csv_cols, "FeelTheRush", ingest_dir, selection)
+    file_metas.append(meta)
+
+    if dumps: dumps.submit(debug_file_ftr, ftr_runs, "Feel The Rush", read_cols)
+
+    with profiler.stage('clean'):
+        runs = merge_runs(runs, ftr_runs)
+    return (runs, file_metas)
+
+# Merge the runs of a PPT and an FTR file into a new list, sorted by date and cleaned up
+def merge_runs(ppt_runs, ftr_runs):
+    # Merge FTR runs into the PPT runs
+    runs = ppt_runs + ftr_runs
+    runs.sort(key=lambda r: r.date)
+
+    # clean up data
+    remove_absences(runs)
+    group_level_and_class(runs)
+    return runs
+
+# Load the runs of many PPT and FTR exports, found by find_csv_files() from a list of paths
+# Each file is detected as PPT or FTR from its header, and the files are parsed by the
+# worker processes of the executor if there is one. The runs of all files are merged in
+# date order and a run that is in several files is only kept from the first (see run_key()).
+# Returns the runs, cleaned up like load_runs(), and the meta data of each file
+def load_runs_from_files(paths, ingest_dir=INGEST_DIR, executor=None, selection=None):
+    files = find_csv_files(paths)
+    with profiler.stage('read_csv'):
+        if executor is None:
+            results = [read_source_csv(file, ingest_dir, selection) for file in files]
+        else:
+            results = list(executor.map(read_source_csv, files, itertools.repeat(ingest_dir), itertools.repeat(selection)))
+
+    for (file, result) in zip(files, results):
+        if result is None:
+            log.warning('Skipping %s: not a PawPrintTrials or FeelTheRushTrials CSV file', file)
+    with profiler.stage('clean'):
+        return merge_file_runs([r for r in results if r is not None])
+
+# Merge the runs of many files, the (runs, file meta) of each, without the duplicates
+# Returns the runs, sorted by date and cleaned up, and the meta data of each file
+def merge_file_runs(results):
+    # PPT files first, so runs on the same day are in the same order as with load_runs()
+    results = sorted(results, key=lambda r: source_order(r[1]['Source']))
+    file_runs = [runs for (runs, meta) in results]
+    file_metas = [meta for (runs, meta) in results]
+    for runs in file_runs:
+        runs.sort(key=lambda r: r.date)
+
+    # Remove the runs that an earlier file has too (the runs of the same file, such as
+    # two runs of a class that is not recognized, are never duplicates of each other)
+    rows = sum(len(r) for r in file_runs)
+    seen = set()
+    for (i, runs) in enumerate(file_runs):
+        keys = [run_key(run) for run in runs]
+        if seen:
+            file_runs[i] = [run for (run, key) in zip(runs, keys) if key not in seen]
+        seen.update(keys)
+
+    # Merge the runs of all files in date order
+    runs = list(heapq.merge(*file_runs, key=lambda r: r.date))
+    log.info('%d runs from %d files (%d duplicates removed)', len(runs), len(file_metas), rows - len(runs))
+
+    # clean up data
+    remove_absences(runs)
+    group_level_and_class(runs)
+    return (runs, file_metas)
+
+# Write the complete HTML report of the runs from load_runs() to out (a text file)
+# The cache and the executor (from create_plot_executor()) are optional
+# With a ShardWriter the report is written as its pages instead (and out is not used)
+# With a RunSelection the report only has the runs since its first date; the stats continue
+# from the histories (from StatsCheckpoints.histories()) if the runs start after the first run
+def render_report(out, runs, file_metas, cache=None, executor=None, jobs=1, shards=None, selection=None, histories=None, with_plots=True):
+    if cache is None:
+        cache = FragmentCache(None, 0)
+
+    with profiler.stage('partition'):
+        # Get lists of unique dogs and catlog classes into groups
+        dogs = group_dogs(runs)
+
+        # Index the runs by dog and group (each list remains in date order)
+        partitions = partition_runs(runs)
+
+    # Calculate and add statistics columns to the data 
+    numpy_stats = compute_stats(partitions, dogs, histories)
+
+    if selection:
+        partitions = selection.select_since(partitions, numpy_stats)
+        dogs = [dog for dog in dogs if any((dog, group) in partitions for group in groups)]
+
+    if shards:
+        for dog in dogs:
+            shards.write_dog(dog, partitions, numpy_stats, cache, executor, jobs, with_plots)
+        shards.finish(file_metas)
+        return
+    write_html_header(out)
+    write_file_table(out, file_metas)
+    write_dog_sections(out, dogs, partitions, numpy_stats, cache, executor, jobs, with_plots=with_plots)
+    write_html_footer(out)
+
+# Write the HTML report like render_report(), but reading the CSV files one dog at a time
+# The runs of both files are spilled into a temporary file per dog, and each dog is then
+# loaded, calculated and written on its own, so only one dog's runs are in memory
+# With paths, the runs of all the CSV files found in them are read instead, with the
+# duplicates removed like load_runs_from_files(). With a ShardWriter the report is written
+# as its pages instead (and out is not used). With a RunSelection only the selected runs
+# are read and reported, like render_report(). With a Leaderboard the runs of each dog are
+# added to it as they are loaded. Without with_plots the report has only the tables
+def render_report_stream(out, ppt_file=ppt_csv_file, ftr_file=ftr_csv_file, cache=None, executor=None, jobs=1, paths=None, shards=None, selection=None, leaderboard=None, with_plots=True):
+    if cache is None:
+        cache = FragmentCache(None, 0)
+    if paths:
+        sources = [(file, detect_source(file)) for file in find_csv_files(paths)]
+        for (file, source) in sources:
+            if source is None:
+                log.warning('Skipping %s: not a PawPrintTrials or FeelTheRushTrials CSV file', file)
+        sources = sorted(((file, source) for (file, source) in sources if source), key=lambda s: source_order(s[1]))
+    else:
+        sources = [(ppt_file, "PawPrint"), (ftr_file, "FeelTheRush")]
+
+    # Stream the runs of the CSV files into a spill file per dog
+    with tempfile.TemporaryDirectory() as spill_dir:
+        spill = DogSpill(spill_dir)
+        file_metas = [dict() for source in sources]
+        # keys of the runs of the files already read (only to remove duplicates with paths)
+        seen = set()
+        with profiler.stage('read_csv'):
+            for ((file, source), file_meta) in zip(sources, file_metas):
+                keys = set()
+                for run in clean_runs(iter_csv(file, source_cols[source], source, file_meta, selection)):
+                    if paths:
+                        key = run_key(run)
+                        if key in seen:
+                            continue
+                        keys.add(key)
+                    spill.add(run)
+                seen.update(keys)
+            spill.close()
+
+        if not shards:
+            write_html_header(out)
+            write_file_table(out, file_metas)
+        # load, calculate and write one dog at a time
+        for dog in spill.dogs():
+            with profiler.stage('partition'):
+                dog_runs = spill.load(dog)
+                dog_runs.sort(key=lambda r: r.date)
+                partitions = partition_runs(dog_runs)
+            if leaderboard is not None:
+                leaderboard.add(dog_runs, selection)
+            numpy_stats = compute_stats(partitions, [dog])
+            if selection:
+                partitions = selection.select_since(partitions, numpy_stats)
+                if not partitions:
+                    continue
+            if shards:
+                shards.write_dog(dog, partitions, numpy_stats, cache, executor, jobs, with_plots)
+            else:
+                write_dog_sections(out, [dog], partitions, numpy_stats, cache, executor, jobs, with_plots=with_plots)
+        if shards:
+            shards.finish(file_metas)
+        else:
+            write_html_footer(out)
+
+# Keeps the report up to date with its CSV files (--watch), in a long running process
+# The sizes & modification times of the files are checked every WATCH_INTERVAL seconds.
+# Once they change and then stay the same for WATCH_DEBOUNCE seconds, the report is built
+# again. The parsed runs of each file and the rendered section of each dog are kept in
+# memory between builds: only the files that changed are read again, and only the dogs
+# whose runs changed are calculated and rendered. The report is written to a temporary
+# file that then replaces it, so a browser never loads half a report. With a leaderboard
+# file, the leaderboard of all the runs is saved again after each build.
+class ReportWatcher:
+    def __init__(self, report, paths=None, ingest_dir=None, selection=None, leaderboard_file=None, season=None, with_plots=True):
+        self.report = report
+        self.paths = paths
+        self.ingest_dir = ingest_dir
+        self.selection = selection
+        self.leaderboard_file = leaderboard_file
+        # NAC year the leaderboard is ranked by (see Leaderboard)
+        self.season = season
+        self.with_plots = with_plots
+        # file: (size & modification time, (runs, file meta)) of each file when it was read
+        self.files = dict()
+        # dog: (key of its runs, its rendered section)
+        self.sections = dict()
+
+    # The size & modification time of each input file (None if it is missing)
+    # Only the PPT & FTR exports of the paths are watched, not the files the report writes
+    def signature(self):
+        files = find_source_files(self.paths) if self.paths else [ppt_csv_file, ftr_csv_file]
+        signature = dict()
+        for file in files:
+            try:
+                stat = os.stat(file)
+                signature[file] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                signature[file] = None
+        return signature
+
+    # The (runs, file meta) of each file, reading only the files that changed since last time
+    # (None for an --input file that is not a PPT or FTR export)
+    def read_files(self, signature):
+        files = dict()
+        for (file, stat) in signature.items():
+            if file in self.files and self.files[file][0] == stat:
+                files[file] = self.files[file]
+            elif self.paths:
+                files[file] = (stat, read_source_csv(file, self.ingest_dir, self.selection))
+                if files[file][1] is None:
+                    log.warning('Skipping %s: not a PawPrintTrials or FeelTheRushTrials CSV file', file)
+            else:
+                source = "PawPrint" if file == ppt_csv_file else "FeelTheRush"
+                files[file] = (stat, read_csv(file, source_cols[source], source, self.ingest_dir, self.selection))
+        self.files = files
+        return [result for (stat, result) in files.values()]
+
+    # Key of the runs of a dog (without their stats), to tell if its section changed
+    @staticmethod
+    def dog_key(dog_partitions):
+        h = hashlib.sha256()
+        for (key, table_runs) in dog_partitions.items():
+            h.update(repr(key).encode('utf-8'))
+            for run in table_runs:
+                h.update(repr(run.fields()[:-1]).encode('utf-8'))
+        return h.hexdigest()
+
+    # Build the report from the files as they are now
+    def build(self, signature, cache, executor, jobs):
+        results = self.read_files(signature)
+        with profiler.stage('clean'):
+            if self.paths:
+                (runs, file_metas) = merge_file_runs([r for r in results if r is not None])
+            else:
+                runs = merge_runs(results[0][0], results[1][0])
+                file_metas = [meta for (file_runs, meta) in results]
+        with profiler.stage('partition'):
+            dogs = group_dogs(runs)
+            partitions = partition_runs(runs)
+
+        sections = dict()
+        for dog in dogs:
+            dog_partitions = {(dog, group): partitions[(dog, group)] for group in groups if (dog, group) in partitions}
+            key = self.dog_key(dog_partitions)
+            if dog in self.sections and self.sections[dog][0] == key:
+                sections[dog] = self.sections[dog]
+                continue
+            log.debug('  Changed: %s', dog)
+            numpy_stats = compute_stats(dog_partitions, [dog])
+            if self.selection:
+                dog_partitions = self.selection.select_since(dog_partitions, numpy_stats)
+            buffer = io.StringIO()
+            if dog_partitions:
+                write_dog_sections(buffer, [dog], dog_partitions, numpy_stats, cache, executor, jobs, with_plots=self.with_plots)
+            sections[dog] = (key, buffer.getvalue())
+        changed = sum(1 for dog in dogs if sections[dog] is not self.sections.get(dog))
+        self.sections = sections
+
+        with open(self.report + '.tmp', 'w', buffering=WRITE_BUFFER_SIZE) as w:
+            write_html_header(w)
+            write_file_table(w, file_metas)
+            for dog in dogs:
+                w.write(sections[dog][1])
+            write_html_footer(w)
+        os.replace(self.report + '.tmp', self.report)
+        log.info('Wrote %s (%d of %d dogs changed)', self.report, changed, len(dogs))
+        if self.leaderboard_file:
+            leaderboard = Leaderboard(self.season)
+            leaderboard.add(runs, self.selection)
+            save_leaderboard(self.leaderboard_file, leaderboard)
+
+    # Build the report, and build it again each time the files change, until interrupted
+    def run(self, cache, executor, jobs):
+        log.info('Watching the input files of %s (Ctrl-C to stop)', self.report)
+        built = None
+        pending = self.signature()
+        changed_at = None
+        try:
+            while True:
+                signature = self.signature()
+                if signature != pending:
+                    # the files are changing: wait until they stay the same
+                    pending = signature
+                    changed_at = time.monotonic()
+                elif signature != built and (changed_at is None or time.monotonic() - changed_at >= WATCH_DEBOUNCE):
+                    try:
+                        self.build(signature, cache, executor, jobs)
+                        cache.evict()
+                    except Exception:
+                        # keep watching: the next change of the files may fix it
+                        log.exception('Could not write %s', self.report)
+                    built = signature
+                time.sleep(WATCH_INTERVAL)
+        except KeyboardInterrupt:
+            log.info('Stopped watching')
+
+# Command line entry point: write the report (and debug files) of the CSV files
+def main(argv=None):
+    global PLOT_MAX_POINTS, PLOT_DOWNSAMPLE, PLOT_FORMAT, STATS_BACKEND
+    parser = argparse.ArgumentParser(description='Dog Agility Trial Summary Reporter')
+    parser.add_argument('--jobs', type=int, default=PLOT_JOBS, metavar='N',
+                        help='number of worker processes to render plots and parse --input files (default: %(default)s)')
+    parser.add_argument('--cache', default=CACHE_DIR, metavar='DIR',
+                        help='directory to cache rendered tables and plots between runs')
+    parser.add_argument('--ingest-cache', default=INGEST_DIR, metavar='DIR',
+                        help='directory to save parsed CSV rows in, so only appended rows are parsed')
+    parser.add_argument('--input', action='append', metavar='PATH',
+                        help='read all the PPT & FTR CSV files of a directory, glob or file (repeatable) '
+                             'instead of the two default files; runs in several files are kept once')
+    parser.add_argument('--run-store', default=RUN_STORE_DIR, metavar='DIR',
+                        help='directory to save the cleaned runs in as NumPy arrays; the next report of '
+                             'unchanged input files loads them instead of reading the CSV files')
+    parser.add_argument('--shard-dir', default=SHARD_DIR, metavar='DIR',
+                        help='write the report to DIR as an index page and a page per dog, with the plots as '
+                             'lazy loaded files; only the pages of changed dogs are rewritten')
+    parser.add_argument('--stream', action='store_true',
+                        help='process one dog at a time to bound memory use (no debug files)')
+    parser.add_argument('--stats-backend', default=STATS_BACKEND, choices=('python', 'numpy'),
+                        help='engine used to calculate the running averages (default: %(default)s)')
+    parser.add_argument('--plot-format', default=PLOT_FORMAT, choices=('svg', 'svg-lite', 'png'),
+                        help='format of the plots; svg-lite needs no matplotlib (default: %(default)s)')
+    parser.add_argument('--plot-max-points', type=int, default=PLOT_MAX_POINTS, metavar='N',
+                        help='downsample plots of more than N runs (0 for no limit; default: %(default)s)')
+    parser.add_argument('--plot-downsample', default=PLOT_DOWNSAMPLE, choices=('lttb', 'week', 'month', 'none'),
+                        help='how plots of more than --plot-max-points runs are downsampled (default: %(default)s)')
+    parser.add_argument('--no-plots', dest='plots', action='store_false',
+                        help='write the tables only, without rendering any plots')
+    parser.add_argument('--leaderboard', action='store_true',
+                        help='also write a leaderboard of the dogs of each group to ' + leaderboard_file
+                             + '.html, .csv & .json (in the --shard-dir if given)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and write the report again whenever the input files change')
+    parser.add_argument('--dog', action='append', metavar='NAME',
+                        help='only report the runs of this dog (repeatable)')
+    parser.add_argument('--group', action='append', choices=groups,
+                        help='only report the runs of this group (repeatable)')
+    parser.add_argument('--source', action='append', choices=tuple(source_cols),
+                        help='only read the files of this source (repeatable)')
+    parser.add_argument('--since', type=parse_date, metavar='MM/DD/YYYY',
+                        help='only report the runs on or after this date (the averages still count the runs before it)')
+    parser.add_argument('--until', type=parse_date, metavar='MM/DD/YYYY',
+                        help='only report the runs on or before this date')
+    parser.add_argument('--season', type=int, metavar='YEAR',
+                        help='only report the runs of the season of this NAC year (instead of --since & --until)')
+    parser.add_argument('--dump-format', default=DUMP_FORMAT, choices=tuple(dump_extensions),
+                        help='format of the debug files (default: %(default)s)')
+    parser.add_argument('--dump-gzip', action='store_true', default=DUMP_GZIP,
+                        help='compress the debug files with gzip')
+    parser.add_argument('--log-level', default=LOG_LEVEL, choices=('debug', 'info', 'warning', 'error'),
+                        help='level of the progress messages (default: %(default)s)')
+    parser.add_argument('--profile', action='store_true',
+                        help='record the time, calls and memory of each stage and table in ' + profile_file)
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile, trace the memory allocated by each stage (slow)')
+    parser.add_argument('--profile-cprofile', action='store_true',
+                        help='with --profile, also profile each function with cProfile (saved in ' + profile_stats_file + ')')
+    args = parser.parse_args(argv)
+    if args.season:
+        if args.since or args.until:
+            parser.error('--season can not be used with --since or --until')
+        (args.since, args.until) = nac_season(args.season)
+    if args.watch and (args.stream or args.shard_dir or args.run_store):
+        parser.error('--watch can not be used with --stream, --shard-dir or --run-store')
+    STATS_BACKEND = args.stats_backend
+    PLOT_FORMAT = args.plot_format
+    PLOT_MAX_POINTS = args.plot_max_points
+    PLOT_DOWNSAMPLE = args.plot_downsample
+    logging.basicConfig(level=args.log_level.upper(), format='%(message)s', stream=sys.stdout)
+    if args.profile or args.profile_memory or args.profile_cprofile:
+        profiler.start(args.profile_memory, args.profile_cprofile)
+    cache = FragmentCache(args.cache, CACHE_MAX_BYTES)
+
+    executor = create_plot_executor(args.jobs)
+    # the debug files are written in the background (not in --stream mode, as that
+    # would need all the runs in memory)
+    dumps = DumpWriter(args.dump_format, args.dump_gzip) if CREATE_DEBUG_FILES and not (args.stream or args.watch) else None
+
+    selection = None
+    if args.dog or args.group or args.source or args.since or args.until:
+        selection = RunSelection(args.dog, args.group, args.source, args.since, args.until)
+    # the running averages at the start of the selected runs, from the stats checkpoints
+    histories = None
+
+    if args.watch:
+        ReportWatcher(report_file, args.input, args.ingest_cache, selection,
+                      leaderboard_file if args.leaderboard else None, args.season, args.plots).run(cache, executor, args.jobs)
+        if executor:
+            executor.shutdown()
+        return
+
+    if args.run_store and args.stream:
+        log.warning('--run-store is not used with --stream')
+    if not args.stream:
+        # the input files, to check if the run store has their runs
+        input_files = find_source_files(args.input) if args.input else [ppt_csv_file, ftr_csv_file]
+        store = RunStore(args.run_store) if args.run_store else None
+        if store and store.matches(input_files, bool(args.input)):
+            with profiler.stage('read_csv'):
+                start = None
+                # the checkpoints are of the runs of all sources
+                if selection and selection.since and selection.sources is None:
+                    # load the runs from the start of the season, continuing from its checkpoint
+                    start = nac_season(nac_year(selection.since))[0]
+                    histories = store.checkpoints().histories(start)
+                runs = store.load(selection=selection, start=start)
+                file_metas = store.file_metas()
+        elif store:
+            # the store is saved with all the runs, and the selection made from them
+            if args.input:
+                (runs, file_metas) = load_runs_from_files(args.input, args.ingest_cache, executor)
+            else:
+                (runs, file_metas) = load_runs(ppt_csv_file, ftr_csv_file, args.ingest_cache, dumps)
+            store.save(runs, file_metas, input_files, bool(args.input))
+            if selection:
+                runs = [run for run in runs if selection.selects_run(run)]
+        else:
+            if args.input:
+                (runs, file_metas) = load_runs_from_files(args.input, args.ingest_cache, executor, selection)
+            else:
+                (runs, file_metas) = load_runs(ppt_csv_file, ftr_csv_file, args.ingest_cache, dumps, selection)
+
+    # the leaderboard of the selected runs, from one pass over them
+    leaderboard = Leaderboard(args.season) if args.leaderboard else None
+    if leaderboard is not None and not args.stream:
+        with profiler.stage('leaderboard'):
+            leaderboard.add(runs, selection)
+
+    if args.shard_dir:
+        # Create the pages of the report
+        log.info('Writing %s', args.shard_dir)
+        # a report of selected runs only replaces the pages of the dogs it has
+        shards = ShardWriter(args.shard_dir, args.leaderboard, selection is not None)
+        if args.stream:
+            render_report_stream(None, ppt_csv_file, ftr_csv_file, cache, executor, args.jobs, args.input, shards, selection, leaderboard, args.plots)
+        else:
+            render_report(None, runs, file_metas, cache, executor, args.jobs, shards, selection, histories, args.plots)
+    else:
+        # Create the HTML output file
+        log.info('Writing %s', report_file)
+        with open(report_file, 'w', buffering=WRITE_BUFFER_SIZE) as w:
+            if args.stream:
+                render_report_stream(w, ppt_csv_file, ftr_csv_file, cache, executor, args.jobs, args.input, selection=selection, leaderboard=leaderboard, with_plots=args.plots)
+            else:
+                render_report(w, runs, file_metas, cache, executor, args.jobs, selection=selection, histories=histories, with_plots=args.plots)
+
+    # optionally create the debug file with all data in one giant table
+    # (the runs have their stats now, so they no longer change)
+    if dumps: dumps.submit(debug_file, runs, "Dump of All Data")
+
+    if leaderboard is not None:
+        save_leaderboard(os.path.join(args.shard_dir, leaderboard_file) if args.shard_dir else leaderboard_file, leaderboard)
+
+    if executor:
+        executor.shutdown()
+
+    cache.evict()
+    cache.print_stats()
+    if dumps:
+        with profiler.stage('dump_wait'):
+            dumps.wait()
+
+    if profiler.enabled:
+        summary = profiler.stop(profile_stats_file if args.profile_cprofile else None)
+        with open(profile_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+        log_profile(summary)
+        log.info('Profile saved to %s', profile_file)
+
+    # Let the user know this script came to completion
+    log.info('Done.')
+
+# # 
+# # Main execution starts here
+# #    
 
-# Let the user know this script came to completion
-print('Done.')
+if __name__ == '__main__':
+    main()
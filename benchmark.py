@@ -0,0 +1,354 @@
+# Dog Agility Trial Summary Reporter - Benchmark
+# Copyright (c) 2023 John Vedder.  MIT License
+#
+# Measures the performance of AgilitySummaryReporter.py on synthetic data, so it
+# can be checked without anyone's private PPT/FTR exports. Generates a PawPrintTrials
+# and a FeelTheRushTrials CSV file in the exact ppt_csv_cols and ftr_csv_cols layouts
+# (with a configurable number of runs, dogs, years and mix of classes), then times each
+# stage of the report on them and measures the peak memory of each stage.
+#
+# Prints a table of the stages and, with --json, writes a JSON summary for comparing
+# runs of the benchmark over time. For example:
+#
+#   python benchmark.py --runs 10000 --json bench-10k.json
+#   python benchmark.py --runs 1000000 --dogs 20 --years 10 --stats-backend numpy
+#
+# Note: with --trace-memory the peak memory of each stage is measured with tracemalloc,
+# which makes every stage several times slower. Without it only the peak RSS of the
+# process after each stage is reported (which only ever goes up).
+
+import argparse
+import contextlib
+import csv
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import AgilitySummaryReporter as asr
+
+# Default mix of PPT classes (the 'Class' column) and their relative weights
+DEFAULT_CLASS_MIX = "Master Std #1:3,Master JWW #1:3,Master Std #2:1,Master JWW #2:1," \
+                    "Premier Std:1,Prem JWW:1,Master FAST:1,T2B:1,Excellent Std:0.5"
+
+# The FTR 'Class' column for each agility class
+ftr_classes = {"Std": "Std", "JWW": "JWW", "FAST": "FAST", "T2B": "T2B"}
+
+# Share of the runs that are in the FTR file (the rest are in the PPT file)
+FTR_SHARE = 0.2
+
+# Last day of the generated runs, fixed so the same options give the same files
+LAST_DATE = datetime.date(2025, 12, 31)
+
+# Parse a class mix like 'Master Std:3,T2B:1' into a list of (class, weight)
+def parse_class_mix(text):
+    mix = []
+    for item in text.split(','):
+        (name, sep, weight) = item.rpartition(':')
+        if not sep:
+            (name, weight) = (weight, '1')
+        mix.append((name.strip(), float(weight)))
+    return mix
+
+# Generate one PPT row (a list in the order of ppt_csv_cols)
+def make_ppt_row(rnd, date, dog, ppt_class, index):
+    agility_class = asr.get_class(ppt_class)
+    result = rnd.choices(('Q', 'NQ', 'A'), (6, 3, 1))[0]
+    sct = rnd.randint(35, 75)
+    time_text = '%.2f' % (sct * rnd.uniform(0.7, 1.1))
+    yards = rnd.randint(140, 200) if agility_class in ('Std', 'JWW') else ''
+    yps = '%.2f' % (yards / float(time_text)) if yards else ''
+    faults = [str(rnd.choices((0, 1, 2), (20, 3, 1))[0]) for f in asr.fault_names]
+    score = str(rnd.randint(40, 90)) if agility_class == 'FAST' else ''
+    mach_pts = str(max(0, sct - int(float(time_text)))) if result == 'Q' and agility_class != 'T2B' else ''
+    t2b_pts = str(rnd.randint(1, 20)) if result == 'Q' and agility_class == 'T2B' else ''
+    values = {
+        "Date": date.strftime(asr.FORMAT_DATE),
+        "Trial": 'Club %d' % rnd.randint(1, 40),
+        "Location": 'Town %d' % rnd.randint(1, 25),
+        "Dog": dog,
+        "Handler": 'Handler of ' + dog,
+        "Class": ppt_class,
+        "Judge": 'Judge %d' % rnd.randint(1, 60),
+        "Yards": str(yards),
+        "SCT": str(sct),
+        "Time": time_text,
+        "YPS": yps,
+        "Score": score,
+        "Result": result,
+        "Place": str(rnd.randint(1, 4)) if result == 'Q' else '',
+        "MACH Pts": mach_pts,
+        "T2B Pts": t2b_pts,
+        "Top25": 'Y' if rnd.random() < 0.05 else '',
+        "Run ID": str(1000000 + index),
+    }
+    values.update(zip(asr.fault_names, faults))
+    return [values[c] for c in asr.ppt_csv_cols]
+
+# Generate one FTR row (a list in the order of ftr_csv_cols)
+def make_ftr_row(rnd, date, dog_id, dog, ppt_class):
+    agility_class = asr.get_class(ppt_class)
+    result = rnd.choices(('Q', 'NQ', 'A'), (6, 3, 1))[0]
+    sct = rnd.randint(35, 75)
+    time_text = '%.2f' % (sct * rnd.uniform(0.7, 1.1))
+    if agility_class == 'FAST':
+        points = str(rnd.randint(40, 90))
+    elif result == 'Q':
+        points = str(rnd.randint(1, 20))
+    else:
+        points = '0'
+    values = {
+        # FTR exports the dog name as a link
+        "Dogname": '<a href="/dog/%d">%s</a>' % (dog_id, dog),
+        "Trial Date": date.strftime(asr.FORMAT_DATE),
+        "Club": 'Club %d' % rnd.randint(1, 40),
+        "Trial Day": '2' if '#2' in ppt_class else '1',
+        "Judge": 'Judge %d' % rnd.randint(1, 60),
+        "Level": asr.get_level(ppt_class),
+        "Class": ftr_classes.get(agility_class, agility_class),
+        "SCT": str(sct),
+        "Points": points,
+        "Time": time_text,
+        "Qual": result,
+    }
+    return [values[c] for c in asr.ftr_csv_cols]
+
+# Write a PPT and an FTR CSV file with runs spread evenly over the years before LAST_DATE
+# Trials are on weekends; each run picks a random dog and a class from the class mix
+def generate_csv_files(ppt_file, ftr_file, runs, dogs, years, class_mix, seed):
+    rnd = random.Random(seed)
+    dog_names = ['Dog %d' % i for i in range(dogs)]
+    (class_names, class_weights) = zip(*class_mix)
+    first_date = LAST_DATE - datetime.timedelta(days=365 * years)
+    weekends = [first_date + datetime.timedelta(days=d) for d in range((LAST_DATE - first_date).days + 1)]
+    weekends = [d for d in weekends if d.weekday() >= 5]
+    ftr_runs = int(runs * FTR_SHARE)
+    ppt_runs = runs - ftr_runs
+    with open(ppt_file, 'w', newline='', encoding='utf-8-sig') as f:
+        w = csv.writer(f)
+        w.writerow(asr.ppt_csv_cols)
+        for i in range(ppt_runs):
+            date = weekends[i * len(weekends) // ppt_runs]
+            ppt_class = rnd.choices(class_names, class_weights)[0]
+            w.writerow(make_ppt_row(rnd, date, rnd.choice(dog_names), ppt_class, i))
+    with open(ftr_file, 'w', newline='', encoding='utf-8-sig') as f:
+        w = csv.writer(f)
+        w.writerow(asr.ftr_csv_cols)
+        for i in range(ftr_runs):
+            date = weekends[i * len(weekends) // ftr_runs]
+            ppt_class = rnd.choices(class_names, class_weights)[0]
+            dog_id = rnd.randrange(dogs)
+            w.writerow(make_ftr_row(rnd, date, dog_id, dog_names[dog_id], ppt_class))
+
+# Peak resident memory of this process so far in bytes
+def max_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+# Times the stages of the benchmark and measures their memory
+class StageTimer:
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.stages = dict()
+
+    # Time one stage: 'with timer.stage(name, items):' around the code of the stage
+    # items is the number of things (runs, cells, plots) the stage processes
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            (start_bytes, peak) = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        result = {'seconds': round(seconds, 4), 'items': items, 'max_rss_bytes': max_rss()}
+        if items:
+            result['items_per_second'] = round(items / seconds, 1) if seconds else None
+        if self.trace_memory:
+            (current, peak) = tracemalloc.get_traced_memory()
+            result['peak_bytes'] = peak - start_bytes
+        self.stages[name] = result
+
+    # Set the number of items of a stage that was only known at its end
+    def set_items(self, name, items):
+        stage = self.stages[name]
+        stage['items'] = items
+        stage['items_per_second'] = round(items / stage['seconds'], 1) if stage['seconds'] else None
+
+# The raw texts of some columns of each row of a generated CSV file
+def read_columns(file, csv_cols, cols):
+    positions = [csv_cols.index(c) for c in cols]
+    with open(file, newline='', encoding='utf-8-sig') as f:
+        f.readline()
+        return [[row[i] for i in positions] for row in csv.reader(f) if len(row) > 5]
+
+# Run each stage of the report on the generated CSV files
+def run_stages(timer, ppt_file, ftr_file, directory, max_plots, dump_format, dump_gzip):
+    with timer.stage('read_csv'):
+        # includes mapping the CSV columns to runs (and the fault columns to Faults)
+        (runs, ppt_meta) = asr.read_csv(ppt_file, asr.ppt_csv_cols, "PawPrint")
+        (ftr_runs, ftr_meta) = asr.read_csv(ftr_file, asr.ftr_csv_cols, "FeelTheRush")
+    timer.set_items('read_csv', len(runs) + len(ftr_runs))
+
+    # the lookups that normalize the text of each row on their own (also part of read_csv):
+    # the PPT class & fault counts, the FTR dog name, level & class, the fault text & group
+    ppt_texts = read_columns(ppt_file, asr.ppt_csv_cols, ["Class"] + list(asr.fault_names))
+    ftr_texts = read_columns(ftr_file, asr.ftr_csv_cols, ["Dogname", "Level", "Class"])
+    with timer.stage('normalize', len(ppt_texts) + len(ftr_texts)):
+        for texts in ppt_texts:
+            asr.classify_ppt_class(texts[0])
+            asr.fault_counts(*texts[1:])
+        for (dog, level, ftr_class) in ftr_texts:
+            asr.ftr_dog_name(dog)
+            asr.get_level(level)
+            asr.get_class(ftr_class)
+        for run in itertools.chain(runs, ftr_runs):
+            asr.format_faults(run.faults)
+            asr.run_group(run)
+    ppt_texts = ftr_texts = None
+
+    with timer.stage('clean', len(runs) + len(ftr_runs)):
+        runs.extend(ftr_runs)
+        ftr_runs = None
+        runs.sort(key=lambda r: r.date)
+        asr.remove_absences(runs)
+        asr.group_level_and_class(runs)
+
+    with timer.stage('partition', len(runs)):
+        dogs = asr.group_dogs(runs)
+        partitions = asr.partition_runs(runs)
+
+    with timer.stage('calc_stats', len(runs)):
+        numpy_stats = asr.compute_stats(partitions, dogs)
+        for (key, table_stats) in numpy_stats.items():
+            asr.write_stats(partitions[key], table_stats)
+
+    with timer.stage('leaderboard', len(runs)):
+        leaderboard = asr.Leaderboard()
+        leaderboard.add(runs)
+        asr.save_leaderboard(os.path.join(directory, asr.leaderboard_file), leaderboard)
+
+    tables =[(dog, group, partitions[(dog, group)]) for dog in dogs for group in asr.groups
+              if (dog, group) in partitions and group != "Other"]
+    cells = sum(len(table_runs) * len(asr.table_cols[group]) for (dog, group, table_runs) in tables)
+    with timer.stage('render_tables', cells):
+        for (dog, group, table_runs) in tables:
+            asr.render_table(dog, group, asr.table_cols[group], table_runs)
+
+    plots = [(table_runs, col) for (dog, group, table_runs) in tables
+             for col in asr.group_stat_cols[group]]
+    if max_plots is not None:
+        plots = plots[:max_plots]
+    # the size and the time of each plot
+    plot_sizes = []
+    with timer.stage('render_plots', len(plots)):
+        for (table_runs, col) in plots:
+            start = time.perf_counter()
+            plot = asr.create_plot_as_svg(table_runs, col)
+            plot_sizes.append((len(plot.encode('utf-8')), time.perf_counter() - start))
+    if plot_sizes:
+        timer.stages['render_plots'].update({
+            'bytes': sum(size for (size, seconds) in plot_sizes),
+            'bytes_per_plot': round(sum(size for (size, seconds) in plot_sizes) / len(plot_sizes)),
+            'max_bytes': max(size for (size, seconds) in plot_sizes),
+            'seconds_per_plot': round(sum(seconds for (size, seconds) in plot_sizes) / len(plot_sizes), 4),
+            'max_seconds': round(max(seconds for (size, seconds) in plot_sizes), 4),
+        })
+
+    with timer.stage('dump_data', len(runs)):
+        asr.dump_data(os.path.join(directory, asr.debug_file), runs, "Dump of All Data",
+                      dump_format=dump_format, compress=dump_gzip)
+    return len(runs)
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the Dog Agility Trial Summary Reporter')
+    parser.add_argument('--runs', type=int, default=10000, help='number of runs to generate (default: %(default)s)')
+    parser.add_argument('--dogs', type=int, default=5, help='number of dogs (default: %(default)s)')
+    parser.add_argument('--years', type=int, default=3, help='number of years of trials (default: %(default)s)')
+    parser.add_argument('--class-mix', default=DEFAULT_CLASS_MIX, metavar='MIX',
+                        help='PPT classes and weights as "Class:weight,..." (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the generator (default: %(default)s)')
+    parser.add_argument('--stats-backend', choices=('python', 'numpy'), default=asr.STATS_BACKEND)
+    parser.add_argument('--plot-format', choices=('svg', 'svg-lite', 'png'), default=asr.PLOT_FORMAT)
+    parser.add_argument('--plot-max-points', type=int, default=asr.PLOT_MAX_POINTS, metavar='N')
+    parser.add_argument('--plot-downsample', choices=('lttb', 'week', 'month', 'none'), default=asr.PLOT_DOWNSAMPLE)
+    parser.add_argument('--dump-format', choices=tuple(asr.dump_extensions), default=asr.DUMP_FORMAT)
+    parser.add_argument('--dump-gzip', action='store_true', default=asr.DUMP_GZIP)
+    parser.add_argument('--max-plots', type=int, default=None, metavar='N',
+                        help='only render the first N plots (default: all)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure the peak memory of each stage with tracemalloc (slow)')
+    parser.add_argument('--dir', default=None, help='directory for the generated files (default: a temporary one)')
+    parser.add_argument('--json', default=None, metavar='FILE', help='write a JSON summary to FILE ("-" for stdout)')
+    args = parser.parse_args(argv)
+    # keep the progress messages of the reporter out of the benchmark output
+    asr.log.setLevel(logging.WARNING)
+
+    asr.STATS_BACKEND = args.stats_backend
+    asr.PLOT_FORMAT = args.plot_format
+    asr.PLOT_MAX_POINTS = args.plot_max_points
+    asr.PLOT_DOWNSAMPLE = args.plot_downsample
+
+    with contextlib.ExitStack() as stack:
+        directory = args.dir or stack.enter_context(tempfile.TemporaryDirectory())
+        ppt_file = os.path.join(directory, asr.ppt_csv_file)
+        ftr_file = os.path.join(directory, asr.ftr_csv_file)
+
+        start = time.perf_counter()
+        generate_csv_files(ppt_file, ftr_file, args.runs, args.dogs, args.years,
+                           parse_class_mix(args.class_mix), args.seed)
+        generate_seconds = time.perf_counter() - start
+
+        timer = StageTimer(args.trace_memory)
+        if args.trace_memory:
+            tracemalloc.start()
+        report_runs = run_stages(timer, ppt_file, ftr_file, directory, args.max_plots,
+                                 args.dump_format, args.dump_gzip)
+        if args.trace_memory:
+            tracemalloc.stop()
+
+    summary = {
+        'params': {k: v for (k, v) in vars(args).items() if k not in ('dir', 'json')},
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'generate_seconds': round(generate_seconds, 4),
+        'report_runs': report_runs,
+        'total_seconds': round(sum(s['seconds'] for s in timer.stages.values()), 4),
+        'stages': timer.stages,
+    }
+
+    # table of the stages
+    print('%-14s %10s %12s %14s %12s' % ('Stage', 'Seconds', 'Items', 'Items/s', 'Peak MB'))
+    for (name, stage) in timer.stages.items():
+        peak = stage.get('peak_bytes', stage['max_rss_bytes'])
+        print('%-14s %10.3f %12s %14s %12.1f' % (name, stage['seconds'], stage['items'],
+              stage.get('items_per_second', ''), peak / 1e6))
+    print('%-14s %10.3f' % ('total', summary['total_seconds']))
+    plots = timer.stages.get('render_plots', dict())
+    if 'bytes_per_plot' in plots:
+        print('Plots: %d, %.1f KB and %.1f ms per plot (largest %.1f KB, slowest %.1f ms)' % (
+              plots['items'], plots['bytes_per_plot'] / 1e3, plots['seconds_per_plot'] * 1e3,
+              plots['max_bytes'] / 1e3, plots['max_seconds'] * 1e3))
+    if not args.trace_memory:
+        print('(Peak MB is the peak RSS of the process; use --trace-memory for each stage)')
+
+    if args.json == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+if __name__ == '__main__':
+    main()
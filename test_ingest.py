@@ -0,0 +1,92 @@
+import csv
+import io
+
+import AgilitySummaryReporter as asr
+
+# A line of a PPT CSV file, with a Place & MACH Pts that can be corrected later
+def ppt_line(i, place='1', mach_pts='10'):
+    values = dict.fromkeys(asr.ppt_csv_cols, '')
+    values.update({"Date": "01/%02d/2024" % (i % 28 + 1), "Trial": "Club", "Dog": "Rex",
+                   "Class": "Master Std #1", "YPS": "4.25", "Result": "Q",
+                   "Place": place, "MACH Pts": mach_pts, "Run ID": str(i)})
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow([values[c] for c in asr.ppt_csv_cols])
+    return buffer.getvalue()
+
+def write(path, lines, mode='w'):
+    with open(path, mode, newline='', encoding='utf-8') as f:
+        if mode == 'w':
+            f.write(','.join(asr.ppt_csv_cols) + '\n')
+        f.write(''.join(lines))
+
+# The runs read with the ingest snapshot, and the runs of a full parse of the file
+def read_both(path, ingest_dir):
+    runs = asr.read_csv_incremental(str(path), asr.ppt_csv_cols, "PawPrint", str(ingest_dir))
+    full = asr.read_csv(str(path), asr.ppt_csv_cols, "PawPrint")[0]
+    return ([run.fields() for run in runs], [run.fields() for run in full])
+
+def test_appended_rows(tmp_path):
+    path = tmp_path / 'ppt.csv'
+    write(path, [ppt_line(i) for i in range(10)])
+    (runs, full) = read_both(path, tmp_path / 'ingest')
+    assert len(runs) == 10 and runs == full
+    write(path, [ppt_line(i) for i in range(10, 15)], mode='a')
+    (runs, full) = read_both(path, tmp_path / 'ingest')
+    assert len(runs) == 15 and runs == full
+
+def test_partial_last_line(tmp_path):
+    path = tmp_path / 'ppt.csv'
+    write(path, [ppt_line(i) for i in range(5)] + [ppt_line(5)[:-1]])
+    (runs, full) = read_both(path, tmp_path / 'ingest')
+    assert len(runs) == 6 and runs == full
+    # the rest of the last line (and another row) is written
+    write(path, ['\n', ppt_line(6)], mode='a')
+    (runs, full) = read_both(path, tmp_path / 'ingest')
+    assert len(runs) == 7 and runs == full
+
+def test_corrected_row_with_appended_row(tmp_path):
+    path = tmp_path / 'ppt.csv'
+    write(path, [ppt_line(i) for i in range(200)])
+    (before, full) = read_both(path, tmp_path / 'ingest')
+    # a correction of the same length early in the file, plus an appended row
+    write(path, [ppt_line(0, place='2', mach_pts='12')] + [ppt_line(i) for i in range(1, 201)])
+    (runs, full) = read_both(path, tmp_path / 'ingest')
+    assert len(runs) == 201 and runs == full
+    assert runs[0] != before[0]
+
+def test_rewritten_file(tmp_path):
+    path = tmp_path / 'ppt.csv'
+    write(path, [ppt_line(i) for i in range(20)])
+    read_both(path, tmp_path / 'ingest')
+    # a shorter file with other rows
+    write(path, [ppt_line(i, place='3') for i in range(100, 105)])
+    (runs, full) = read_both(path, tmp_path / 'ingest')
+    assert len(runs) == 5 and runs == full
+
+# A line of an FTR CSV file
+def ftr_line(level, ftr_class, judge='Smith', points='10'):
+    values = {"Dogname": "Rex", "Trial Date": "01/06/2024", "Club": "Club", "Trial Day": "1", "Judge": judge,
+              "Level": level, "Class": ftr_class, "SCT": "50", "Points": points, "Time": "40", "Qual": "Q"}
+    return ','.join(values[c] for c in asr.ftr_csv_cols) + '\n'
+
+def write_ftr(path, lines):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.write(','.join(asr.ftr_csv_cols) + '\n' + ''.join(lines))
+
+# The same run in the exports of two handlers is only kept once, but runs of one export
+# are never duplicates, even of classes that are not recognized
+def test_duplicates_across_files(tmp_path):
+    lines = [ftr_line('Master', 'Std'), ftr_line('Master', 'Hoopers'), ftr_line('Master', 'Barn Hunt')]
+    write_ftr(tmp_path / 'a.csv', lines)
+    write_ftr(tmp_path / 'b.csv', lines + [ftr_line('Master', 'Std', judge='Jones')])
+    (runs, file_metas) = asr.load_runs_from_files([str(tmp_path)], None)
+    assert len(runs) == 4
+    assert sorted((run.agility_class, run.judge) for run in runs) == [
+        ('', 'Smith'), ('', 'Smith'), ('Std', 'Jones'), ('Std', 'Smith')]
+
+# The input files of a folder are its exports, not the CSV files a report writes in it
+def test_source_files_without_report_outputs(tmp_path):
+    write_ftr(tmp_path / 'ftr.csv', [ftr_line('Master', 'Std')])
+    write(tmp_path / 'ppt.csv', [ppt_line(0)])
+    (tmp_path / 'leaderboard.csv').write_text('Group,Rank,Dog\n')
+    assert sorted(asr.find_source_files([str(tmp_path)])) == [str(tmp_path / 'ftr.csv'), str(tmp_path / 'ppt.csv')]
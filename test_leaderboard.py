@@ -0,0 +1,43 @@
+import datetime
+
+import AgilitySummaryReporter as asr
+
+# Runs of a dog in Master Std: (date, MACH points) of Q runs
+def make_runs(dog, points):
+    runs = []
+    for (date, pts) in points:
+        run = asr.Run("PawPrint")
+        run.dog = dog
+        run.group = "Master Std"
+        run.date = date
+        run.result = "Q"
+        run.yps = 4.0
+        run.mach_pts = pts
+        runs.append(run)
+    return runs
+
+# Fido did best in the 2025 season (Dec 2023 to Nov 2024), Rex in the 2026 season that
+# has just started with the last run
+def make_leaderboard(season=None):
+    leaderboard = asr.Leaderboard(season)
+    runs = (make_runs("Fido", [(datetime.date(2024, 1, 6), 20)] * 5 + [(datetime.date(2024, 12, 7), 1)])
+            + make_runs("Rex", [(datetime.date(2024, 1, 6), 10)] * 5 + [(datetime.date(2024, 12, 8), 15)]))
+    leaderboard.add(sorted(runs, key=lambda run: run.date))
+    return leaderboard
+
+def test_ranked_by_last_complete_season():
+    leaderboard = make_leaderboard()
+    assert leaderboard.nac_year() == 2025
+    rows = leaderboard.rows("Master Std")
+    assert [(row["Rank"], row["Dog"], row["NAC MACH Pts"]) for row in rows] == [(1, "Fido", 100), (2, "Rex", 50)]
+
+def test_ranked_by_given_season():
+    rows = make_leaderboard(2026).rows("Master Std")
+    assert [(row["Dog"], row["NAC MACH Pts"]) for row in rows] == [("Rex", 15), ("Fido", 1)]
+
+def test_points_of_every_season():
+    leaderboard = make_leaderboard()
+    assert leaderboard.nac_years() == [2025, 2026]
+    rows = {row["Dog"]: row for row in leaderboard.rows("Master Std")}
+    assert rows["Fido"]["NAC MACH Pts by Year"] == {2025: 100, 2026: 1}
+    assert rows["Rex"]["MACH Pts"] == 65
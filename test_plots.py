@@ -0,0 +1,58 @@
+import datetime
+
+import AgilitySummaryReporter as asr
+
+cols = ["YPS", "Avg YPS", "Avg15 YPS"]
+dates = [datetime.date(2015, 1, 1) + datetime.timedelta(days=7 * i) for i in range(400)]
+empty_plot = (cols, [], [[], [], []], 5)
+long_plot = (cols, dates, [[4.0] * len(dates)] * 3, 5)
+
+# A plot must render the same whatever plot the renderer rendered before it
+# (--jobs & --cache rely on the plots being the same however they are rendered)
+def test_empty_plot_is_the_same_after_another_plot():
+    fresh = asr.PlotRenderer().render(*empty_plot, 'svg')
+    used = asr.PlotRenderer()
+    used.render(*long_plot, 'svg')
+    assert used.render(*empty_plot, 'svg') == fresh
+
+def test_plot_is_the_same_after_an_empty_plot():
+    fresh = asr.PlotRenderer().render(*long_plot, 'svg')
+    used = asr.PlotRenderer()
+    used.render(*empty_plot, 'svg')
+    assert used.render(*long_plot, 'svg') == fresh
+
+# An svg-lite plot with no points shows the fixed EMPTY_PLOT_DATES year, not today's
+def test_empty_lite_plot_shows_fixed_dates():
+    svg = asr.create_lite_svg(*empty_plot)
+    assert asr.EMPTY_PLOT_DATES[0].strftime('%Y-%m') in svg or asr.EMPTY_PLOT_DATES[1].strftime('%Y-%m') in svg
+    assert datetime.date.today().strftime('%Y-%m') not in svg
+
+# The plot cache keys of svg-lite runs do not need matplotlib installed
+def test_lite_plot_params_without_matplotlib(monkeypatch):
+    def not_found(name):
+        raise asr.importlib.metadata.PackageNotFoundError(name)
+    asr.matplotlib_version.cache_clear()
+    monkeypatch.setattr(asr.importlib.metadata, 'version', not_found)
+    monkeypatch.setattr(asr, 'PLOT_FORMAT', 'svg-lite')
+    assert asr.plot_params()[2] is None
+    asr.matplotlib_version.cache_clear()
+
+# A report without plots has the tables of the report with plots, and no plots
+def test_report_without_plots():
+    runs = []
+    for i in range(10):
+        run = asr.Run("PawPrint")
+        run.dog = "Rex"
+        run.group = "Master Std"
+        run.date = datetime.date(2024, 1, 6) + datetime.timedelta(days=7 * i)
+        run.result = "Q"
+        run.yps = 4.0 + i / 10
+        run.mach_pts = i
+        runs.append(run)
+    reports = []
+    for with_plots in (True, False):
+        out = asr.io.StringIO()
+        asr.render_report(out, runs, [], with_plots=with_plots)
+        reports.append(out.getvalue())
+    assert '<svg' in reports[0] and '<svg' not in reports[1]
+    assert '<table' in reports[1]
@@ -0,0 +1,89 @@
+import datetime
+import random
+import statistics
+
+import pytest
+
+import AgilitySummaryReporter as asr
+
+# Sequences of stat values (None is an empty value, which counts as an int 0)
+sequences = {
+    "tie 4.015": [4.01, 4.02],
+    "tie 2.675": [2.67, 2.68, 2.675, 2.675],
+    "ties in window": [4.015] * 3 + [4.01, 4.02] * 10,
+    "all ints": [3, 5, 8, 13, 2, 2, 9] * 4,
+    "int 0 with floats": [None, 4.25, None, 3.5, 0.0, None, 4.1] * 4,
+    "negatives": [-1.25, 3.0, -0.5, -2.675, 1.01, -4.015] * 4,
+    "no fixed point": [1 / 3, 2 / 3, 0.1 + 0.2, 1e-9, 3.14159265358979] * 4,
+    "too big for fixed point": [1e15 + 0.5, 2.25, 3e15, 1.1] * 5,
+}
+
+random_sequences = [[round(random.Random(seed).uniform(0, 6), 2) for i in range(40)] for seed in range(20)]
+
+# Columns & results of the runs: every third run is an NQ, whose value must not count
+def make_runs(values, start=datetime.date(2021, 1, 1), days=10):
+    runs = []
+    for (i, value) in enumerate(values):
+        for result in (("Q", "NQ") if i % 3 == 2 else ("Q",)):
+            run = asr.Run("PawPrint")
+            run.dog = "Dog"
+            run.group = "Other"
+            run.date = start + datetime.timedelta(days=days * len(runs))
+            run.result = result
+            # the NQ runs have a value that would change the averages
+            run.score = value if result == "Q" else 99.99
+            runs.append(run)
+    return runs
+
+# The text of the averages of a stat column of the runs, as in the report
+def stats_text(runs, col):
+    return [(run.get("Avg " + col), run.get("Avg15 " + col)) for run in runs]
+
+# The expected text of the averages, from statistics.mean()
+def reference_text(runs, col):
+    text = []
+    values = []
+    for run in runs:
+        value = asr.stat_value(run, col)
+        if value is None:
+            text.append(('', ''))
+            continue
+        values.append(value)
+        window = asr.stat_windows[col]
+        text.append((str(round(statistics.mean(values), 2)), str(round(statistics.mean(values[-window:]), 2))))
+    return text
+
+# Calculate the stats of the runs with an engine, continuing from the histories
+def calc(engine, runs, histories=None):
+    partitions = {("Dog", "Other"): runs}
+    if engine == "python":
+        asr.calc_stats(partitions, ["Dog"], ["Other"], histories)
+    else:
+        stats = asr.calc_stats_numpy(partitions, ["Dog"], ["Other"], histories)
+        asr.write_stats(runs, stats[("Dog", "Other")])
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+@pytest.mark.parametrize("values", list(sequences.values()) + random_sequences,
+                         ids=list(sequences) + ["random %d" % i for i in range(len(random_sequences))])
+def test_stats_match_statistics_mean(engine, values):
+    runs = make_runs(values)
+    calc(engine, runs)
+    for col in ("Score", "Q Rate"):
+        assert stats_text(runs, col) == reference_text(runs, col)
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_stats_continue_from_checkpoint(engine):
+    values = random_sequences[0] * 3 + sequences["tie 2.675"] + sequences["no fixed point"]
+    # about 4 years of runs, so there are checkpoints at the start of 3 seasons
+    expected = make_runs(values)
+    calc("python", expected)
+    checkpoints = asr.StatsCheckpoints.build({("Dog", "Other"): make_runs(values)})
+    for year in (2023, 2024, 2025):
+        start = asr.nac_season(year)[0]
+        histories = checkpoints.histories(start)
+        assert ("Dog", "Other") in histories
+        runs = [run for run in make_runs(values) if run.date >= start]
+        calc(engine, runs, histories)
+        tail = expected[len(expected) - len(runs):]
+        for col in ("Score", "Q Rate"):
+            assert stats_text(runs, col) == stats_text(tail, col) == reference_text(expected, col)[len(expected) - len(runs):]